@@ -0,0 +1,66 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.urls import URLPattern
+from foodgram.middleware import timed
+from rest_framework.permissions import SAFE_METHODS
+
+ASYNC_ROUTES = ('list', 'detail')
+
+
+def run_view(view, request, *args, **kwargs):
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            with timed('render'):
+                response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    """Асинхронная обёртка синхронного представления для ASGI.
+
+    Под ASGI Django выполняет синхронные представления в одном общем
+    потоке, поэтому запросы обрабатываются по одному. Обёртка запускает
+    чтение в пуле потоков с собственным соединением с базой, а ожидание
+    медленных клиентов остаётся в цикле событий. Изменяющие запросы
+    по-прежнему выполняются в общем потоке, как без обёртки.
+    """
+    run = sync_to_async(run_view, thread_sensitive=False)
+    run_shared = sync_to_async(view, thread_sensitive=True)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return await run(view, request, *args, **kwargs)
+        return await run_shared(request, *args, **kwargs)
+
+    return wrapper
+
+
+def async_urls(urls, basenames):
+    """Заменяет на async представления списка и объекта для basenames.
+
+    Дополнительные действия роутера, в том числе потоковая выгрузка
+    корзины, остаются синхронными.
+    """
+    names = {
+        f'{basename}-{route}'
+        for basename in basenames
+        for route in ASYNC_ROUTES
+    }
+    return [
+        URLPattern(
+            url.pattern,
+            async_view(url.callback),
+            url.default_args,
+            url.name,
+        )
+        if url.name in names
+        else url
+        for url in urls
+    ]
@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import OrderedDict
+from copy import deepcopy
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+KEY_PREFIX = 'auth-token'
+
+
+class TokenCache:
+    """Кэш токенов с пользователями: LRU в памяти процесса и общий кэш.
+
+    Запись в памяти процесса живёт TOKEN_CACHE_TTL секунд, всего хранится
+    не больше TOKEN_CACHE_SIZE записей. Если задан TOKEN_CACHE_ALIAS,
+    промахи сначала ищутся в этом кэше Django, где запись живёт
+    TOKEN_CACHE_SHARED_TTL секунд, а попадание в памяти процесса
+    действительно, только пока запись есть в общем кэше. Сброс удаляет
+    запись в текущем процессе и в общем кэше, поэтому другие процессы
+    видят его при следующем запросе. Без общего кэша сброс не доходит
+    до памяти других процессов, и запись там доживает до конца TTL.
+    Каждый запрос получает свою копию токена и пользователя.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._tokens = OrderedDict()
+        self._user_keys = {}
+
+    @property
+    def generation(self):
+        """Номер сброса: загруженное до сброса не попадает в кэш"""
+        return self._generation
+
+    @property
+    def shared(self):
+        alias = settings.TOKEN_CACHE_ALIAS
+        return None if alias is None else caches[alias]
+
+    @staticmethod
+    def token_key(key):
+        return f'{KEY_PREFIX}:{key}'
+
+    @staticmethod
+    def user_key(user_id):
+        return f'{KEY_PREFIX}-user:{user_id}'
+
+    def get(self, key):
+        shared = self.shared
+        token = None
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._tokens.move_to_end(key)
+                    token = entry[1]
+                else:
+                    self._pop(key)
+        if token is not None:
+            # Сброс в другом процессе удаляет запись из общего кэша.
+            if shared is None or shared.has_key(self.token_key(key)):
+                return deepcopy(token)
+            with self._lock:
+                if self._tokens.get(key) is entry:
+                    self._pop(key)
+            return None
+        token = None if shared is None else shared.get(self.token_key(key))
+        if token is not None:
+            self._remember(deepcopy(token))
+        return token
+
+    def set(self, token, generation):
+        if generation != self._generation:
+            return
+        token = deepcopy(token)
+        shared = self.shared
+        if shared is not None:
+            shared.set_many({
+                self.token_key(token.key): token,
+                self.user_key(token.user_id): token.key,
+            }, settings.TOKEN_CACHE_SHARED_TTL)
+        self._remember(token)
+
+    def invalidate(self, key=None, user_id=None):
+        """Сбрасывает токен по ключу или все токены пользователя"""
+        shared = self.shared
+        keys = set()
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                key = self._user_keys.get(user_id)
+            if key is not None:
+                keys.add(key)
+                self._pop(key)
+        if shared is None:
+            return
+        shared_keys = []
+        if user_id is not None:
+            shared_keys.append(self.user_key(user_id))
+            cached = shared.get(self.user_key(user_id))
+            if cached is not None:
+                keys.add(cached)
+        shared_keys.extend(self.token_key(key) for key in keys)
+        shared.delete_many(shared_keys)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._tokens.clear()
+            self._user_keys.clear()
+
+    def _remember(self, token):
+        ttl = settings.TOKEN_CACHE_TTL
+        if not ttl:
+            return
+        with self._lock:
+            self._pop(token.key)
+            self._tokens[token.key] = (time.monotonic() + ttl, token)
+            self._user_keys[token.user_id] = token.key
+            while len(self._tokens) > settings.TOKEN_CACHE_SIZE:
+                self._pop(next(iter(self._tokens)))
+
+    def _pop(self, key):
+        entry = self._tokens.pop(key, None)
+        if entry is not None:
+            user_id = entry[1].user_id
+            if self._user_keys.get(user_id) == key:
+                del self._user_keys[user_id]
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к базе для недавно виденных токенов.
+
+    Токен с пользователем берётся из token_cache; кэш сбрасывается
+    сигналами при удалении токена и сохранении или удалении пользователя,
+    в том числе при выходе, смене пароля и деактивации.
+    """
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            generation = token_cache.generation
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(token, generation)
+            return user, token
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        return token.user, token
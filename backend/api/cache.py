@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.core.cache import caches
+from recipes.utils import chunked
+
+KEY_PREFIX = 'recipe'
+DELETE_BATCH_SIZE = 1000
+
+
+class RecipeCache:
+    """Кэш общей для всех пользователей части представления рецепта.
+
+    Хранит по id рецепта пару (версия, данные) в кэше
+    RECIPE_CACHE_ALIAS; размер и вытеснение задаются настройками этого
+    кэша. Версия собирается из уже загруженных рецепта с его готовыми
+    вариантами изображения, автора, тегов и ингредиентов, поэтому
+    запись, устаревшая в кэше другого процесса, не будет отдана. Сигналы
+    удаляют записи сразу при изменении связанных моделей.
+    """
+
+    @property
+    def cache(self):
+        alias = settings.RECIPE_CACHE_ALIAS
+        return None if alias is None else caches[alias]
+
+    @staticmethod
+    def key(recipe_id):
+        return f'{KEY_PREFIX}:{recipe_id}'
+
+    @staticmethod
+    def version(recipe):
+        author = recipe.author
+        return (
+            recipe.updated_at,
+            recipe.image_variants,
+            author.email,
+            author.username,
+            author.first_name,
+            author.last_name,
+            [(tag.id, tag.updated_at) for tag in recipe.tags.all()],
+            [
+                (item.ingredient_id, item.amount, item.ingredient.updated_at)
+                for item in recipe.ingredients_amount.all()
+            ],
+        )
+
+    def get_many(self, recipes, render):
+        """Данные рецептов по id; промахи строятся одним вызовом render"""
+        cache = self.cache
+        if cache is None:
+            return {
+                recipe.id: data
+                for recipe, data in zip(recipes, render(recipes))
+            }
+        versions = {recipe.id: self.version(recipe) for recipe in recipes}
+        result = {}
+        for key, (version, data) in cache.get_many(
+            [self.key(pk) for pk in versions]
+        ).items():
+            pk = int(key.rsplit(':', 1)[1])
+            if version == versions[pk]:
+                result[pk] = data
+        missing = [recipe for recipe in recipes if recipe.id not in result]
+        if not missing:
+            return result
+        rendered = {}
+        for recipe, data in zip(missing, render(missing)):
+            result[recipe.id] = data
+            rendered[self.key(recipe.id)] = (versions[recipe.id], data)
+        cache.set_many(rendered)
+        return result
+
+    def invalidate(self, recipe_ids):
+        cache = self.cache
+        if cache is None:
+            return
+        for ids in chunked(recipe_ids, DELETE_BATCH_SIZE):
+            cache.delete_many([self.key(pk) for pk in ids])
+
+
+recipe_cache = RecipeCache()
@@ -0,0 +1,57 @@
+import binascii
+import uuid
+from base64 import b64decode
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.template.defaultfilters import filesizeformat
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+
+DECODE_CHUNK_SIZE = 64 * 1024
+
+
+class StreamingBase64ImageField(serializers.ImageField):
+    """Изображение в base64, декодируемое частями во временный файл.
+
+    Размер проверяется до декодирования, а сами байты не собираются
+    в памяти целиком: Pillow проверяет файл на диске. Ссылку на уже
+    загруженное изображение можно передать только при частичном
+    обновлении: тогда поле пропускается.
+    """
+    default_error_messages = {
+        'too_large': 'Размер изображения не должен превышать {max_size}.',
+        'invalid_base64': 'Некорректные данные изображения.',
+        'url_not_allowed': 'Ожидается изображение в base64, а не ссылка.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and data.startswith('http'):
+            if not self.root.partial:
+                self.fail('url_not_allowed')
+            raise SkipField()
+        if isinstance(data, str) and data.startswith('data:'):
+            data = self.decode(data)
+        return super().to_internal_value(data)
+
+    def decode(self, data):
+        header, _, encoded = data.partition(';base64,')
+        content_type = header[len('data:'):]
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if len(encoded) // 4 * 3 > max_size:
+            self.fail('too_large', max_size=filesizeformat(max_size))
+        extension = content_type.split('/')[-1]
+        upload = TemporaryUploadedFile(
+            f'{uuid.uuid4()}.{extension}', content_type, 0, None
+        )
+        try:
+            for start in range(0, len(encoded), DECODE_CHUNK_SIZE):
+                upload.write(b64decode(
+                    encoded[start:start + DECODE_CHUNK_SIZE], validate=True
+                ))
+        except (binascii.Error, ValueError):
+            upload.close()
+            self.fail('invalid_base64')
+        upload.size = upload.tell()
+        upload.seek(0)
+        return upload
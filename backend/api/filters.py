@@ -1,19 +1,37 @@
-from django_filters.rest_framework import CharFilter, FilterSet, filters
+from django import forms
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            TrigramSimilarity)
+from django.db import connection
+from django.db.models import Exists, F, OuterRef, Q
+from django_filters.rest_framework import FilterSet, filters
 from django_filters.widgets import BooleanWidget
-from recipes.models import Ingredient, Recipe
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCart
 
 
-class IngredientSearchFilter(FilterSet):
-    name = CharFilter(field_name='name', lookup_expr='istartwith')
+class MultipleValueField(forms.Field):
+    """Список значений параметра без перечисления допустимых вариантов"""
+    widget = forms.MultipleHiddenInput
 
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
+    def __init__(self, *args, base_field=forms.CharField, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.base_field = base_field()
+
+    def to_python(self, value):
+        return [
+            self.base_field.clean(item)
+            for item in value or [] if item not in self.empty_values
+        ]
+
+
+class MultipleValueFilter(filters.Filter):
+    field_class = MultipleValueField
 
 
 class RecipeFilter(FilterSet):
-    author = filters.AllValuesMultipleFilter(
-        field_name='author__id',
+    author = MultipleValueFilter(
+        field_name='author_id',
+        lookup_expr='in',
+        base_field=forms.IntegerField,
         label='Автор'
     )
     is_in_shopping_cart = filters.BooleanFilter(
@@ -26,20 +44,55 @@ class RecipeFilter(FilterSet):
         label='В избранных.',
         method='get_is_favorited'
     )
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = MultipleValueFilter(
+        base_field=forms.SlugField,
+        label='Теги',
+        method='get_tags'
+    )
+    search = filters.CharFilter(
+        label='Поиск по названию и описанию',
+        method='get_search'
+    )
 
     class Meta:
         model = Recipe
-        fields = ['author', 'tags', 'is_in_shopping_cart', 'is_favorited']
+        fields = [
+            'author', 'tags', 'is_in_shopping_cart', 'is_favorited', 'search'
+        ]
+
+    def get_tags(self, queryset, name, value):
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'), tag__slug__in=value
+        )))
 
     def get_is_favorited(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(favorites__user=user)
+            return queryset.filter(Exists(FavoriteRecipe.objects.filter(
+                user=user, recipe_id=OuterRef('pk')
+            )))
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(cart__user=user)
+            return queryset.filter(Exists(ShoppingCart.objects.filter(
+                user=user, recipe_id=OuterRef('pk')
+            )))
         return queryset
+
+    def get_search(self, queryset, name, value):
+        value = value.strip()
+        if not value:
+            return queryset
+        if connection.vendor != 'postgresql':
+            return queryset.filter(
+                Q(name__icontains=value) | Q(text__icontains=value)
+            )
+        query = SearchQuery(value, config='russian', search_type='websearch')
+        return queryset.filter(
+            Q(search_vector=query) | Q(name__trigram_similar=value)
+        ).annotate(
+            rank=SearchRank(F('search_vector'), query),
+            similarity=TrigramSimilarity('name', value),
+        ).order_by('-rank', '-similarity', '-pub_date')
@@ -0,0 +1,34 @@
+from hashlib import md5
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from foodgram.middleware import timed
+
+
+class ConditionalGetMixin:
+    """Условные GET-запросы: ETag/Last-Modified и ответ 304.
+
+    Валидаторы вычисляются до сериализации, поэтому при совпадении
+    клиент получает 304 без построения тела ответа. Построение тела
+    учитывается в Server-Timing как serialize.
+    """
+    vary_headers = ()
+
+    def conditional_response(self, request, respond, version,
+                             last_modified=None):
+        etag = quote_etag(md5(repr(version).encode()).hexdigest())
+        timestamp = (
+            None if last_modified is None else int(last_modified.timestamp())
+        )
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            with timed('serialize'):
+                response = respond()
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        if self.vary_headers:
+            patch_vary_headers(response, self.vary_headers)
+        return response
@@ -1,6 +1,133 @@
-from rest_framework.pagination import PageNumberPagination
+from collections import OrderedDict
+
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import (BasePagination, Cursor,
+                                       CursorPagination, PageNumberPagination)
+from rest_framework.response import Response
+
+POSITION_SEPARATOR = '|'
+CURSOR_ORDERING_CONFLICT = (
+    'Параметр задаёт свой порядок записей и не сочетается '
+    'с курсорной пагинацией'
+)
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class RecipeCursorPagination(CursorPagination):
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+
+
+class SubscriptionCursorPagination(CursorPagination):
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = ('id',)
+
+
+class CursorOptInPagination(BasePagination):
+    """Постраничная пагинация, курсорная по запросу клиента.
+
+    Курсорный режим включается параметром ?pagination=cursor и сохраняется
+    в ссылках next/previous через параметр cursor, остальные клиенты
+    получают прежние номера страниц. Курсор держится на постоянном
+    порядке cursor_class.ordering, поэтому параметры из
+    ordering_query_params, которые задают свой порядок, например
+    сортировку поиска по релевантности, в курсорном режиме отклоняются.
+    """
+    page_number_class = LimitPageNumberPagination
+    cursor_class = RecipeCursorPagination
+    pagination_query_param = 'pagination'
+    ordering_query_params = ('search',)
+
+    def get_paginator(self, request):
+        params = request.query_params
+        if (
+            params.get(self.pagination_query_param) != 'cursor'
+            and self.cursor_class.cursor_query_param not in params
+        ):
+            return self.page_number_class()
+        conflicts = {
+            param: [CURSOR_ORDERING_CONFLICT]
+            for param in self.ordering_query_params
+            if params.get(param, '').strip()
+        }
+        if conflicts:
+            raise ValidationError(conflicts)
+        return self.cursor_class()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = self.get_paginator(request)
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_results(self, data):
+        return self.paginator.get_results(data)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    def get_schema_operation_parameters(self, view):
+        return self.page_number_class().get_schema_operation_parameters(view)
+
+
+class SubscriptionPagination(CursorOptInPagination):
+    cursor_class = SubscriptionCursorPagination
+
+
+class FeedPagination(CursorPagination):
+    """Курсорная пагинация ленты подписок по ключу (pub_date, id).
+
+    Лента собирается из нескольких источников, поэтому страницу строит
+    функция load(before, limit), а курсор хранит ключ последней записи.
+    Ссылки назад нет: лента читается от новых рецептов к старым.
+    """
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+
+    def paginate_feed(self, request, load):
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        before = None if cursor is None else self.parse_position(
+            cursor.position
+        )
+        keys = load(before, self.page_size + 1)
+        self.next_key = (
+            keys[self.page_size - 1] if len(keys) > self.page_size else None
+        )
+        return keys[:self.page_size]
+
+    def parse_position(self, position):
+        try:
+            pub_date, pk = position.rsplit(POSITION_SEPARATOR, 1)
+            pub_date = parse_datetime(pub_date)
+            if pub_date is None:
+                raise ValueError(position)
+            return pub_date, int(pk)
+        except (AttributeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if self.next_key is None:
+            return None
+        pub_date, pk = self.next_key
+        return self.encode_cursor(Cursor(
+            offset=0,
+            reverse=False,
+            position=f'{pub_date.isoformat()}{POSITION_SEPARATOR}{pk}',
+        ))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
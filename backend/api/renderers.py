@@ -0,0 +1,83 @@
+import csv
+import json
+
+from rest_framework import renderers
+
+HEADER_FILE_CART = 'Мой список покупок:\n\nНаименование - Кол-во/Ед.изм.\n'
+CSV_HEADER = ('Наименование', 'Количество', 'Единица измерения')
+
+
+class Echo:
+    """Псевдобуфер для csv.writer, возвращающий записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingCartRenderer(renderers.BaseRenderer):
+    """Базовый потоковый рендерер списка покупок"""
+    charset = 'utf-8'
+    chunk_size = 8192
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            return renderers.JSONRenderer().render(data)
+        return ''.join(self.stream(data)).encode(self.charset)
+
+    def stream(self, ingredients):
+        buffer, size = [], 0
+        for chunk in self.lines(ingredients):
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= self.chunk_size:
+                yield ''.join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield ''.join(buffer)
+
+    def lines(self, ingredients):
+        raise NotImplementedError(
+            'ShoppingCartRenderer.lines() must be implemented.'
+        )
+
+
+class ShoppingCartTextRenderer(ShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def lines(self, ingredients):
+        yield HEADER_FILE_CART
+        separator = ''
+        for ingredient in ingredients:
+            yield (
+                f'{separator}{ingredient["name"]} - {ingredient["amount"]}/'
+                f'{ingredient["measurement_unit"]}'
+            )
+            separator = '\n'
+
+
+class ShoppingCartCSVRenderer(ShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def lines(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(CSV_HEADER)
+        for ingredient in ingredients:
+            yield writer.writerow((
+                ingredient['name'],
+                ingredient['amount'],
+                ingredient['measurement_unit'],
+            ))
+
+
+class ShoppingCartJSONRenderer(ShoppingCartRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def lines(self, ingredients):
+        separator = '['
+        for ingredient in ingredients:
+            yield separator + json.dumps(ingredient, ensure_ascii=False)
+            separator = ', '
+        yield ']' if separator != '[' else '[]'
@@ -1,17 +1,27 @@
+from collections import Counter, OrderedDict
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db.models import Manager, Prefetch, prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_base64.fields import Base64ImageField
+from recipes.images import recorded_variants, schedule_variants
 from recipes.models import (FavoriteRecipe, Ingredient, IngredientInRecipe,
-                            Recipe, ShoppingCart, Tag)
+                            Recipe, ShoppingCart, ShoppingListItem, Tag)
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 from users.models import Follow
 
+from .cache import recipe_cache
+from .fields import StreamingBase64ImageField
+
 User = get_user_model()
 
 
 class GetIsSubscribedMixin:
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -45,7 +55,7 @@ class CustomUserListSerializer(GetIsSubscribedMixin, UserSerializer):
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
-        fields = '__all__'
+        fields = ('id', 'name', 'color', 'slug')
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -54,11 +64,15 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit',)
 
 
-class IngredientsEditSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-        source='ingredient'
+class IngredientSearchSerializer(serializers.Serializer):
+    name = serializers.CharField(
+        source='query', required=False, allow_blank=True, trim_whitespace=False
     )
+    limit = serializers.IntegerField(min_value=1, required=False)
+
+
+class IngredientsEditSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='ingredient')
 
     class Meta:
         model = IngredientInRecipe
@@ -81,14 +95,50 @@ class IngredientAmountSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeAuthorSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ('email', 'id', 'username', 'first_name', 'last_name')
+
+
+class RecipeSharedSerializer(serializers.ModelSerializer):
+    """Общая для всех пользователей часть рецепта, которая кэшируется.
+
+    Строится без запроса в контексте, поэтому ссылки на изображения
+    относительные.
+    """
     tags = TagSerializer(many=True)
-    author = CustomUserListSerializer()
+    author = RecipeAuthorSerializer()
     ingredients = IngredientAmountSerializer(
         many=True,
         source='ingredients_amount',
         required=True,
     )
+    image_variants = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'id', 'tags', 'author', 'ingredients', 'name', 'image',
+            'image_variants', 'text', 'cooking_time'
+        )
+
+    def get_image_variants(self, obj):
+        return {
+            variant: default_storage.url(name)
+            for variant, name in recorded_variants(obj).items()
+        }
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, Manager) else data
+        return self.child.represent_many(list(recipes))
+
+
+class RecipeReadSerializer(RecipeSharedSerializer):
+    """Рецепт: общая часть из кэша и флаги текущего пользователя"""
+    author = CustomUserListSerializer()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -96,10 +146,58 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'name', 'image', 'image_variants', 'text',
+            'cooking_time'
+        )
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        return self.represent_many([instance])[0]
+
+    def represent_many(self, recipes):
+        shared = recipe_cache.get_many(
+            recipes,
+            lambda missing: RecipeSharedSerializer(missing, many=True).data,
+        )
+        return [self.merge(recipe, shared[recipe.id]) for recipe in recipes]
+
+    def merge(self, recipe, shared):
+        request = self.context.get('request')
+
+        def absolute(url):
+            if url and request is not None:
+                return request.build_absolute_uri(url)
+            return url
+
+        own = {
+            'author': {
+                **shared['author'],
+                'is_subscribed': self.get_is_subscribed(recipe),
+            },
+            'is_favorited': self.get_is_favorited(recipe),
+            'is_in_shopping_cart': self.get_is_in_shopping_cart(recipe),
+            'image': absolute(shared['image']),
+            'image_variants': {
+                variant: absolute(url)
+                for variant, url in shared['image_variants'].items()
+            },
+        }
+        return OrderedDict(
+            (field, own[field] if field in own else shared[field])
+            for field in self.Meta.fields
         )
 
+    def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        user = self.context.get('request').user
+        return user.is_authenticated and user.follower.filter(
+            author=obj.author_id
+        ).exists()
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         return (self.context.get('request').user.is_authenticated
                 and FavoriteRecipe.objects.filter(
                     user=self.context.get('request').user,
@@ -107,6 +205,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         ).exists())
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         return (self.context.get('request').user.is_authenticated
                 and ShoppingCart.objects.filter(
                     user=self.context.get('request').user,
@@ -115,12 +215,9 @@ class RecipeReadSerializer(serializers.ModelSerializer):
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all()
-    )
+    tags = serializers.ListField(child=serializers.IntegerField())
     ingredients = IngredientsEditSerializer(many=True)
-    image = Base64ImageField(
+    image = StreamingBase64ImageField(
         max_length=None,
         use_url=True,
     )
@@ -135,10 +232,49 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('1')
         return data
 
+    def validate(self, data):
+        """Разрешает id тегов и ингредиентов одним запросом на модель"""
+        errors = {}
+        tags = data.get('tags')
+        if tags is not None:
+            found_tags = Tag.objects.in_bulk(tags)
+            missing = sorted(set(tags) - found_tags.keys())
+            if missing:
+                errors['tags'] = [f'Теги не найдены: {missing}']
+            data['tags'] = [
+                found_tags[pk] for pk in dict.fromkeys(tags)
+                if pk in found_tags
+            ]
+
+        ingredients = data.get('ingredients')
+        if ingredients is not None:
+            ids = Counter(item['ingredient'] for item in ingredients)
+            found_ingredients = Ingredient.objects.in_bulk(ids)
+            ingredient_errors = []
+            missing = sorted(ids.keys() - found_ingredients.keys())
+            if missing:
+                ingredient_errors.append(f'Ингредиенты не найдены: {missing}')
+            duplicates = sorted(pk for pk, count in ids.items() if count > 1)
+            if duplicates:
+                ingredient_errors.append(
+                    f'Ингредиенты указаны повторно: {duplicates}'
+                )
+            if ingredient_errors:
+                errors['ingredients'] = ingredient_errors
+            else:
+                for item in ingredients:
+                    item['ingredient'] = found_ingredients[item['ingredient']]
+
+        if errors:
+            raise serializers.ValidationError(errors)
+        return data
+
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
+        if 'image' in validated_data:
+            validated_data['image'].close()
         recipe.tags.set(tags)
 
         create_ingredients = [
@@ -152,32 +288,90 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         IngredientInRecipe.objects.bulk_create(
             create_ingredients
         )
+        if 'image' in validated_data:
+            schedule_variants(recipe)
         return recipe
 
+    def update_ingredients(self, recipe, ingredients):
+        """Применяет к рецепту только изменившиеся ингредиенты.
+
+        Возвращает разницу количеств {ingredient_id: разница}.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in recipe.ingredients_amount.all()
+        }
+        previous = {
+            ingredient_id: item.amount
+            for ingredient_id, item in current.items()
+        }
+        amounts = {
+            ingredient['ingredient'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        create_ingredients = [
+            IngredientInRecipe(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=amount,
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        ]
+        update_ingredients = []
+        delete_ids = []
+        for ingredient_id, item in current.items():
+            if ingredient_id not in amounts:
+                delete_ids.append(item.id)
+            elif item.amount != amounts[ingredient_id]:
+                item.amount = amounts[ingredient_id]
+                update_ingredients.append(item)
+
+        if delete_ids:
+            IngredientInRecipe.objects.filter(id__in=delete_ids).delete()
+        if update_ingredients:
+            IngredientInRecipe.objects.bulk_update(
+                update_ingredients, ('amount',)
+            )
+        if create_ingredients:
+            IngredientInRecipe.objects.bulk_create(create_ingredients)
+        return {
+            ingredient_id: (
+                amounts.get(ingredient_id, 0) - previous.get(ingredient_id, 0)
+            )
+            for ingredient_id in {*amounts, *previous}
+        }
+
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients', None)
         tags = validated_data.pop('tags', None)
         if tags is not None:
-            instance.tags.clear()
             instance.tags.set(tags)
 
         if ingredients is not None:
-            instance.ingredients.clear()
-            create_ingredients = [
-                IngredientInRecipe(
-                    recipe=instance,
-                    ingredient=ingredient['ingredient'],
-                    amount=ingredient['amount'],
-                )
-                for ingredient in ingredients
-            ]
-
-            IngredientInRecipe.objects.bulk_create(
-                create_ingredients
+            ShoppingListItem.objects.apply_amounts(
+                instance.cart.values_list('user_id', flat=True),
+                self.update_ingredients(instance, ingredients),
             )
-        return super().update(instance, validated_data)
+        if 'image' in validated_data:
+            validated_data['image_variants'] = []
+        instance = super().update(instance, validated_data)
+        if 'image' in validated_data:
+            validated_data['image'].close()
+            schedule_variants(instance)
+        return instance
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance],
+            'tags',
+            Prefetch(
+                'ingredients_amount',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
         return RecipeReadSerializer(
             instance,
             context=self.context).data
@@ -190,7 +384,7 @@ class RecipeAddingSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
 
-class FollowSerializer(GetIsSubscribedMixin, serializers.ModelSerializer):
+class FollowSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField(source='author.id')
     email = serializers.ReadOnlyField(source='author.email')
     username = serializers.ReadOnlyField(source='author.username')
@@ -205,100 +399,33 @@ class FollowSerializer(GetIsSubscribedMixin, serializers.ModelSerializer):
         fields = ('id', 'email', 'username', 'first_name', 'last_name',
                   'is_subscribed', 'recipes', 'recipes_count')
 
+    def get_is_subscribed(self, obj):
+        return obj.user_id == self.context.get('request').user.id
+
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        queryset = obj.author.recipes.all()
-        if limit:
-            queryset = queryset[:int(limit)]
-        return RecipeAddingSerializer(queryset, many=True).data
+        author_recipes = self.context.get('author_recipes')
+        if author_recipes is not None:
+            recipes = author_recipes.get(obj.author_id, [])
+        else:
+            recipes = obj.author.recipes.all()
+            limit = self.context.get('recipes_limit')
+            if limit:
+                recipes = recipes[:limit]
+        return RecipeAddingSerializer(recipes, many=True).data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.author.recipes.all().count()
 
 
-class CheckSubscribeSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Follow
-        fields = ('user', 'author')
+class RecipesLimitSerializer(serializers.Serializer):
+    recipes_limit = serializers.IntegerField(min_value=1, required=False)
 
-    def validate(self, obj):
-        user = obj['user']
-        author = obj['author']
-        subscribed = user.follower.filter(author=author).exists()
 
-        if self.context.get('request').method == 'POST':
-            if user == author:
-                raise serializers.ValidationError(
-                    'Ошибка, на себя подписка не разрешена'
-                )
-            if subscribed:
-                raise serializers.ValidationError(
-                    'Ошибка, вы уже подписались'
-                )
-        if self.context.get('request').method == 'DELETE':
-            if user == author:
-                raise serializers.ValidationError(
-                    'Ошибка, отписка от самого себя не разрешена'
-                )
-            if not subscribed:
-                raise serializers.ValidationError(
-                    {'errors': 'Ошибка, вы уже отписались'}
-                )
-        return obj
-
-
-class CheckFavoriteSerializer(serializers.ModelSerializer):
-    user = serializers.PrimaryKeyRelatedField(
-        queryset=User.objects.all()
-    )
-    recipe = serializers.PrimaryKeyRelatedField(
-        queryset=Recipe.objects.all()
+class BatchIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_MAX_IDS,
     )
-
-    class Meta:
-        model = FavoriteRecipe
-        fields = ('user', 'recipe')
-
-    def validate(self, obj):
-        user = self.context['request'].user
-        recipe = obj['recipe']
-        favorite = user.favorites.filter(recipe=recipe).exists()
-
-        if self.context.get('request').method == 'POST' and favorite:
-            raise serializers.ValidationError(
-                'Этот рецепт уже добавлен в избранном'
-            )
-        if self.context.get('request').method == 'DELETE' and not favorite:
-            raise serializers.ValidationError(
-                'Этот рецепт отсутствует в избранном'
-            )
-        return obj
-
-
-class CheckShoppingCartSerializer(serializers.ModelSerializer):
-    user = serializers.PrimaryKeyRelatedField(
-        queryset=User.objects.all()
-    )
-    recipe = serializers.PrimaryKeyRelatedField(
-        queryset=Recipe.objects.all()
-    )
-
-    class Meta:
-        model = ShoppingCart
-        fields = ('user', 'recipe')
-
-    def validate(self, obj):
-        user = self.context['request'].user
-        recipe = obj['recipe']
-        cart = user.cart.filter(recipe=recipe).exists()
-
-        if self.context.get('request').method == 'POST' and cart:
-            raise serializers.ValidationError(
-                'Этот рецепт уже добавлен в корзину'
-            )
-        if self.context.get('request').method == 'DELETE' and not cart:
-            raise serializers.ValidationError(
-                'Этот рецепт отсутствует в корзине'
-            )
-        return obj
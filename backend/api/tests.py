@@ -0,0 +1,59 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from recipes.models import Recipe
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import AuthorStats
+
+User = get_user_model()
+PASSWORD = 'Counters-password-1'
+
+
+class DeleteUserCountersTest(TestCase):
+    """Удаление аккаунта уменьшает счётчики, в которые входили его связи"""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password=PASSWORD
+        )
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password=PASSWORD
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Суп', text='Сварить', cooking_time=10
+        )
+        self.own_recipe = Recipe.objects.create(
+            author=self.user, name='Каша', text='Сварить', cooking_time=5
+        )
+        AuthorStats.objects.change_counter(
+            'recipes_count', [self.author.id, self.user.id], 1
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=(
+            f'Token {Token.objects.create(user=self.user).key}'
+        ))
+        for path in (
+            f'/api/recipes/{self.recipe.id}/favorite/',
+            f'/api/recipes/{self.recipe.id}/shopping_cart/',
+            f'/api/users/{self.author.id}/subscribe/',
+        ):
+            self.assertEqual(self.client.post(path).status_code, 201)
+
+    def test_counters_before_delete(self):
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(self.recipe.in_carts_count, 1)
+        self.assertEqual(self.author.stats.followers_count, 1)
+
+    def test_delete_me(self):
+        response = self.client.delete(
+            '/api/users/me/', {'current_password': PASSWORD}, format='json'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(User.objects.filter(pk=self.user.id).exists())
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+        self.assertEqual(self.recipe.in_carts_count, 0)
+        stats = AuthorStats.objects.get(user=self.author)
+        self.assertEqual(stats.followers_count, 0)
+        self.assertEqual(stats.recipes_count, 1)
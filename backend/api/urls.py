@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from .async_views import async_urls
 from .views import FollowViewSet, IngredientViewSet, RecipeViewSet, TagViewSet
 
 app_name = 'api'
@@ -11,8 +13,12 @@ router.register('recipes', RecipeViewSet, basename='recipes')
 router.register('tags', TagViewSet)
 router.register('ingredients', IngredientViewSet)
 
+router_urls = router.urls
+if settings.ASYNC_VIEWS:
+    router_urls = async_urls(router_urls, ('recipes', 'tag', 'ingredient'))
+
 urlpatterns = [
-    path('', include(router.urls)),
+    path('', include(router_urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
 ]
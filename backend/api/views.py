@@ -1,66 +1,211 @@
+from collections import defaultdict
 from http import HTTPStatus
 
 from django.contrib.auth import get_user_model
 from django.db import transaction
-from django.db.models import Sum
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
 from djoser.views import UserViewSet
-from recipes.models import (FavoriteRecipe, Ingredient, IngredientInRecipe,
-                            Recipe, ShoppingCart, Tag)
+from foodgram.middleware import timed
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (RECIPE_COUNTERS, FavoriteRecipe, FeedEntry,
+                            Ingredient, Recipe, ShoppingCart, ShoppingListItem,
+                            Tag, before_recipes_delete, before_users_delete,
+                            get_version)
+from recipes.utils import (delete_returning, insert_if_exists,
+                           insert_many_if_exist)
 from rest_framework import viewsets
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.viewsets import ReadOnlyModelViewSet
-from users.models import Follow
+from users.models import AuthorStats, Follow
 
-from .filters import IngredientSearchFilter, RecipeFilter
+from .cache import recipe_cache
+from .filters import RecipeFilter
+from .mixins import ConditionalGetMixin
+from .paginations import (CursorOptInPagination, FeedPagination,
+                          SubscriptionPagination)
 from .permissions import IsAdminAuthorOrReadOnly
-from .serializers import (CheckFavoriteSerializer, CheckShoppingCartSerializer,
-                          CheckSubscribeSerializer, FollowSerializer,
-                          IngredientSerializer, RecipeAddingSerializer,
-                          RecipeReadSerializer, RecipeWriteSerializer,
+from .renderers import (ShoppingCartCSVRenderer, ShoppingCartJSONRenderer,
+                        ShoppingCartTextRenderer)
+from .serializers import (BatchIdsSerializer, FollowSerializer,
+                          IngredientSearchSerializer, IngredientSerializer,
+                          RecipeAddingSerializer, RecipeReadSerializer,
+                          RecipesLimitSerializer, RecipeWriteSerializer,
                           TagSerializer)
 
 User = get_user_model()
-FILENAME = 'shopping_cart.txt'
-HEADER_FILE_CART = 'Мой список покупок:\n\nНаименование - Кол-во/Ед.изм.\n'
+FILENAME = 'shopping_cart'
+SHOPPING_CART_CHUNK_SIZE = 500
+RECIPE_NOT_FOUND = 'Рецепт не найден'
+BATCH_CREATED = 'created'
+BATCH_EXISTS = 'exists'
+BATCH_DELETED = 'deleted'
+BATCH_ABSENT = 'absent'
+BATCH_NOT_FOUND = 'not_found'
+BATCH_SELF = 'self'
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+def serialize(serializer):
+    """Данные сериализатора; время построения попадает в Server-Timing"""
+    with timed('serialize'):
+        return serializer.data
+
+
+def get_batch_ids(request):
+    serializer = BatchIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return list(dict.fromkeys(serializer.validated_data['ids']))
+
+
+def get_batch_present(existing, changed, adding):
+    """Была ли связь до операции; changed — реально изменённые строки"""
+    present = dict.fromkeys(existing, adding)
+    present.update(dict.fromkeys(changed, not adding))
+    return present
+
+
+def get_batch_results(ids, present, adding):
+    """Результат пакетной операции по каждому id в порядке запроса"""
+    if adding:
+        statuses = {False: BATCH_CREATED, True: BATCH_EXISTS}
+    else:
+        statuses = {True: BATCH_DELETED, False: BATCH_ABSENT}
+    return [
+        {
+            'id': pk,
+            'status': (
+                statuses[present[pk]] if pk in present else BATCH_NOT_FOUND
+            ),
+        }
+        for pk in ids
+    ]
+
+
+class TagViewSet(ConditionalGetMixin, ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request,
+            lambda: super(TagViewSet, self).list(request, *args, **kwargs),
+            get_version(self.get_queryset()),
+        )
 
-class Myfilter(SearchFilter):
-    search_param = 'name'
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return self.conditional_response(
+            request,
+            lambda: Response(self.get_serializer(instance).data),
+            (instance.id, instance.updated_at),
+            instance.updated_at,
+        )
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
-    filter_class = IngredientSearchFilter
-    filter_backends = (Myfilter,)
-    search_fields = ('^name',)
+
+    def list(self, request, *args, **kwargs):
+        serializer = IngredientSearchSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        return self.conditional_response(
+            request,
+            lambda: Response(ingredient_index.search(**params)),
+            (ingredient_index.version, sorted(params.items())),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return self.conditional_response(
+            request,
+            lambda: Response(self.get_serializer(instance).data),
+            (instance.id, instance.updated_at),
+            instance.updated_at,
+        )
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = (IsAdminAuthorOrReadOnly,)
     filter_class = RecipeFilter
+    pagination_class = CursorOptInPagination
+    lookup_value_regex = r'\d+'
+    vary_headers = ('Authorization',)
+
+    def get_queryset(self):
+        if self.request.method in SAFE_METHODS:
+            return Recipe.objects.for_read(self.request.user)
+        return super().get_queryset()
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    def get_recipe_version(self, recipe):
+        """Валидатор рецепта: версия общей части из кэша и флаги пользователя.
+
+        Версия кэша включает поля автора, поэтому смена имени автора
+        меняет ETag. Last-Modified для рецептов не отдаётся: у автора
+        нет времени изменения, и 304 по дате было бы устаревшим.
+        """
+        return (
+            recipe.id,
+            recipe_cache.version(recipe),
+            recipe.is_favorited,
+            recipe.is_in_shopping_cart,
+            recipe.is_subscribed,
+        )
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset())
+        )
+        return self.conditional_response(
+            request,
+            lambda: self.get_paginated_response(
+                self.get_serializer(page, many=True).data
+            ),
+            (
+                request.user.id,
+                self.get_paginated_response([]).data,
+                [self.get_recipe_version(recipe) for recipe in page],
+            ),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return self.conditional_response(
+            request,
+            lambda: Response(self.get_serializer(instance).data),
+            (request.user.id, self.get_recipe_version(instance)),
+        )
+
     @transaction.atomic()
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        AuthorStats.objects.change_counter(
+            'recipes_count', [self.request.user.id], 1
+        )
+        FeedEntry.objects.fan_out([serializer.instance.id])
+
+    @transaction.atomic()
+    def perform_update(self, serializer):
+        serializer.save()
+
+    @transaction.atomic()
+    def perform_destroy(self, instance):
+        before_recipes_delete([instance.id])
+        instance.delete()
 
     @action(
         detail=True,
@@ -68,27 +213,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated]
     )
     def favorite(self, request, pk=None):
-        data = {
-            'user': request.user.id,
-            'recipe': pk,
-        }
-        serializer = CheckFavoriteSerializer(
-            data=data, context={'request': request}
+        return self.add_object(
+            FavoriteRecipe, request.user, int(pk),
+            'Этот рецепт уже добавлен в избранном',
         )
-        serializer.is_valid(raise_exception=True)
-        return self.add_object(FavoriteRecipe, request.user, pk)
 
     @favorite.mapping.delete
     def del_favorite(self, request, pk=None):
-        data = {
-            'user': request.user.id,
-            'recipe': pk,
-        }
-        serializer = CheckFavoriteSerializer(
-            data=data, context={'request': request}
+        return self.delete_object(
+            FavoriteRecipe, request.user, int(pk),
+            'Этот рецепт отсутствует в избранном',
         )
-        serializer.is_valid(raise_exception=True)
-        return self.delete_object(FavoriteRecipe, request.user, pk)
 
     @action(
         detail=True,
@@ -96,104 +231,294 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated]
     )
     def shopping_cart(self, request, pk=None):
-        data = {
-            'user': request.user.id,
-            'recipe': pk,
-        }
-        serializer = CheckShoppingCartSerializer(
-            data=data, context={'request': request}
+        return self.add_object(
+            ShoppingCart, request.user, int(pk),
+            'Этот рецепт уже добавлен в корзину',
         )
-        serializer.is_valid(raise_exception=True)
-        return self.add_object(ShoppingCart, request.user, pk)
 
     @shopping_cart.mapping.delete
     def del_shopping_cart(self, request, pk=None):
-        data = {
-            'user': request.user.id,
-            'recipe': pk,
-        }
-        serializer = CheckShoppingCartSerializer(
-            data=data, context={'request': request}
+        return self.delete_object(
+            ShoppingCart, request.user, int(pk),
+            'Этот рецепт отсутствует в корзине',
         )
-        serializer.is_valid(raise_exception=True)
-        return self.delete_object(ShoppingCart, request.user, pk)
 
-    def add_object(self, model, user, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
-        model.objects.create(user=user, recipe=recipe)
+    def get_relation_error(self, pk, message):
+        if not Recipe.objects.filter(pk=pk).exists():
+            return ValidationError({'recipe': [RECIPE_NOT_FOUND]})
+        return ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [message]})
+
+    @transaction.atomic()
+    def add_object(self, model, user, pk, error):
+        if not insert_if_exists(
+            model, {'user': user.id, 'recipe': pk}, 'recipe'
+        ):
+            raise self.get_relation_error(pk, error)
+        Recipe.objects.change_counter(RECIPE_COUNTERS[model], [pk], 1)
+        if model is ShoppingCart:
+            ShoppingListItem.objects.add_recipe([user.id], pk)
+        recipe = Recipe.objects.only(
+            'id', 'name', 'image', 'cooking_time'
+        ).get(pk=pk)
         serializer = RecipeAddingSerializer(recipe)
-        return Response(serializer.data, status=HTTPStatus.CREATED)
+        return Response(serialize(serializer), status=HTTPStatus.CREATED)
 
-    def delete_object(self, model, user, pk):
-        model.objects.filter(user=user, recipe__id=pk).delete()
+    @transaction.atomic()
+    def delete_object(self, model, user, pk, error):
+        deleted, _ = model.objects.filter(user=user, recipe_id=pk).delete()
+        if not deleted:
+            raise self.get_relation_error(pk, error)
+        Recipe.objects.change_counter(RECIPE_COUNTERS[model], [pk], -1)
+        if model is ShoppingCart:
+            ShoppingListItem.objects.remove_recipe([user.id], pk)
         return Response(status=HTTPStatus.NO_CONTENT)
 
     @action(
-        methods=['get'], detail=False, permission_classes=[IsAuthenticated]
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated]
+    )
+    def batch_favorite(self, request):
+        return self.batch_objects(
+            request, FavoriteRecipe, get_batch_ids(request)
+        )
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated]
+    )
+    def batch_shopping_cart(self, request):
+        return self.batch_objects(
+            request, ShoppingCart, get_batch_ids(request)
+        )
+
+    @transaction.atomic()
+    def batch_objects(self, request, model, ids):
+        user = request.user
+        if model is ShoppingCart:
+            User.objects.select_for_update().only('id').get(pk=user.id)
+        adding = request.method == 'POST'
+        existing = list(Recipe.objects.filter(pk__in=ids).values_list(
+            'id', flat=True
+        ).order_by())
+        if adding:
+            changed = insert_many_if_exist(
+                model, {'user': user.id, 'recipe': None}, 'recipe', existing
+            )
+        else:
+            changed = delete_returning(
+                model.objects.filter(user=user, recipe_id__in=existing),
+                'recipe_id',
+            )
+        present = get_batch_present(existing, changed, adding)
+        if changed:
+            Recipe.objects.change_counter(
+                RECIPE_COUNTERS[model], changed, 1 if adding else -1
+            )
+        if model is ShoppingCart and changed:
+            if adding:
+                ShoppingListItem.objects.add_recipes([user.id], changed)
+            else:
+                ShoppingListItem.objects.remove_recipes([user.id], changed)
+        return Response(get_batch_results(ids, present, adding))
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        pagination_class=FeedPagination,
+    )
+    def feed(self, request):
+        """Рецепты авторов из подписок, от новых к старым"""
+        keys = self.paginator.paginate_feed(
+            request,
+            lambda before, limit: FeedEntry.objects.page(
+                request.user, limit, before
+            ),
+        )
+        recipes = Recipe.objects.for_read(request.user).in_bulk(
+            [pk for _, pk in keys]
+        )
+        serializer = self.get_serializer(
+            [recipes[pk] for _, pk in keys if pk in recipes], many=True
+        )
+        return self.paginator.get_paginated_response(serialize(serializer))
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        renderer_classes=(
+            ShoppingCartTextRenderer,
+            ShoppingCartCSVRenderer,
+            ShoppingCartJSONRenderer,
+        ),
     )
     def download_shopping_cart(self, request):
-        ingredients = IngredientInRecipe.objects.filter(
-            recipe__cart__user=request.user
-        ).values(
+        ingredients = request.user.shopping_list.values(
             'ingredient__name',
-            'ingredient__measurement_unit'
-        ).order_by('ingredient__name').annotate(total=Sum('amount'))
-        result = HEADER_FILE_CART
-        result += '\n'.join([
-            f'{ingredient["ingredient__name"]} - {ingredient["total"]}/'
-            f'{ingredient["ingredient__measurement_unit"]}'
-            for ingredient in ingredients
-        ])
-        response = HttpResponse(result, content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename={FILENAME}'
+            'ingredient__measurement_unit',
+            'total',
+        ).order_by('ingredient__name')
+        rows = (
+            {
+                'name': ingredient['ingredient__name'],
+                'amount': ingredient['total'],
+                'measurement_unit': ingredient['ingredient__measurement_unit'],
+            }
+            for ingredient in ingredients.iterator(
+                chunk_size=SHOPPING_CART_CHUNK_SIZE
+            )
+        )
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(rows),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename={FILENAME}.{renderer.format}'
+        )
         return response
 
 
 class FollowViewSet(UserViewSet):
+    lookup_value_regex = r'\d+'
+
+    def get_queryset(self):
+        queryset = super().get_queryset().order_by('id')
+        user = self.request.user
+        if self.action not in ('list', 'retrieve') or user.is_anonymous:
+            return queryset
+        return queryset.annotate(
+            is_subscribed=Exists(user.follower.filter(author=OuterRef('pk')))
+        )
+
+    @transaction.atomic()
+    def perform_destroy(self, instance):
+        before_users_delete([instance.id])
+        super().perform_destroy(instance)
+
+    def get_recipes_limit(self, request):
+        serializer = RecipesLimitSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data.get('recipes_limit')
+
+    def get_author_recipes(self, follows, limit):
+        author_recipes = defaultdict(list)
+        author_ids = [follow.author_id for follow in follows]
+        if author_ids:
+            recipes = Recipe.objects.latest_for_authors(author_ids, limit)
+            for recipe in recipes:
+                author_recipes[recipe.author_id].append(recipe)
+        return author_recipes
+
+    def get_follow_error(self, author_id, detail):
+        if not User.objects.filter(pk=author_id).exists():
+            return NotFound()
+        return ValidationError(detail)
+
     @action(
         methods=['post'],
         detail=True,
         permission_classes=[IsAuthenticated]
     )
+    @transaction.atomic()
     def subscribe(self, request, id=None):
-
+        limit = self.get_recipes_limit(request)
         user = request.user
-        author = get_object_or_404(User, pk=id)
-        data = {
-            'user': user.id,
-            'author': author.id,
-        }
-        serializer = CheckSubscribeSerializer(
-            data=data,
-            context={'request': request},
+        author_id = int(id)
+        if author_id == user.id:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                'Ошибка, на себя подписка не разрешена'
+            ]})
+        if not insert_if_exists(
+            Follow, {'user': user.id, 'author': author_id}, 'author'
+        ):
+            raise self.get_follow_error(
+                author_id, {api_settings.NON_FIELD_ERRORS_KEY: [
+                    'Ошибка, вы уже подписались'
+                ]}
+            )
+        AuthorStats.objects.change_counter('followers_count', [author_id], 1)
+        FeedEntry.objects.backfill([user.id], [author_id])
+        follow = user.follower.select_related('author').annotate(
+            recipes_count=Coalesce('author__stats__recipes_count', 0)
+        ).get(author_id=author_id)
+        serializer = FollowSerializer(
+            follow, context={'request': request, 'recipes_limit': limit}
         )
-        serializer.is_valid(raise_exception=True)
-        result = Follow.objects.create(user=user, author=author)
-        serializer = FollowSerializer(result, context={'request': request})
-        return Response(serializer.data, status=HTTPStatus.CREATED)
+        return Response(serialize(serializer), status=HTTPStatus.CREATED)
 
     @subscribe.mapping.delete
+    @transaction.atomic()
     def del_subscribe(self, request, id=None):
         user = request.user
-        author = get_object_or_404(User, pk=id)
-        data = {
-            'user': user.id,
-            'author': author.id,
-        }
-        serializer = CheckSubscribeSerializer(
-            data=data,
-            context={'request': request},
-        )
-        serializer.is_valid(raise_exception=True)
-        user.follower.filter(author=author).delete()
+        author_id = int(id)
+        if author_id == user.id:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                'Ошибка, отписка от самого себя не разрешена'
+            ]})
+        deleted, _ = user.follower.filter(author_id=author_id).delete()
+        if not deleted:
+            raise self.get_follow_error(
+                author_id, {'errors': 'Ошибка, вы уже отписались'}
+            )
+        AuthorStats.objects.change_counter('followers_count', [author_id], -1)
+        user.feed.filter(author_id=author_id).delete()
         return Response(status=HTTPStatus.NO_CONTENT)
 
-    @action(detail=False, permission_classes=[IsAuthenticated])
-    def subscriptions(self, request):
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated]
+    )
+    def batch_subscribe(self, request):
+        return self.batch_follows(request, get_batch_ids(request))
+
+    @transaction.atomic()
+    def batch_follows(self, request, ids):
         user = request.user
-        queryset = user.follower.all()
+        adding = request.method == 'POST'
+        existing = list(User.objects.filter(pk__in=ids).exclude(
+            pk=user.id
+        ).values_list('id', flat=True).order_by())
+        if adding:
+            changed = insert_many_if_exist(
+                Follow, {'user': user.id, 'author': None}, 'author', existing
+            )
+        else:
+            changed = delete_returning(
+                user.follower.filter(author_id__in=existing), 'author_id'
+            )
+        present = get_batch_present(existing, changed, adding)
+        AuthorStats.objects.change_counter(
+            'followers_count', changed, 1 if adding else -1
+        )
+        if adding:
+            FeedEntry.objects.backfill([user.id], changed)
+        elif changed:
+            user.feed.filter(author_id__in=changed).delete()
+        results = get_batch_results(ids, present, adding)
+        for result in results:
+            if result['id'] == user.id:
+                result['status'] = BATCH_SELF
+        return Response(results)
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        pagination_class=SubscriptionPagination,
+    )
+    def subscriptions(self, request):
+        limit = self.get_recipes_limit(request)
+        queryset = request.user.follower.select_related('author').annotate(
+            recipes_count=Coalesce('author__stats__recipes_count', 0)
+        ).order_by('id')
         pages = self.paginate_queryset(queryset)
         serializer = FollowSerializer(
-            pages, many=True, context={'request': request}
+            pages, many=True, context={
+                'request': request,
+                'author_recipes': self.get_author_recipes(pages, limit),
+            }
         )
-        return self.get_paginated_response(serializer.data)
+        return self.get_paginated_response(serialize(serializer))
@@ -0,0 +1,122 @@
+"""Сравнение пропускной способности WSGI и ASGI на эндпоинтах чтения.
+
+Запуск из каталога backend на заполненной базе:
+
+    python -m benchmarks.asgi_vs_wsgi --requests 500 --concurrency 20
+
+Каждый режим запускается в отдельном процессе, потому что набор
+асинхронных маршрутов определяется настройкой ASYNC_VIEWS при импорте:
+    wsgi       — синхронные представления через WSGI-обработчик;
+    asgi-sync  — те же представления под ASGI без обёртки;
+    asgi       — ASGI с async-обёрткой из api.async_views.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MODES = {
+    'wsgi': 'False',
+    'asgi-sync': 'False',
+    'asgi': 'True',
+}
+
+
+def get_paths():
+    from recipes.models import Ingredient, Recipe
+
+    paths = ['/api/recipes/', '/api/tags/']
+    recipe_id = Recipe.objects.values_list('id', flat=True).first()
+    if recipe_id is not None:
+        paths.append(f'/api/recipes/{recipe_id}/')
+    name = Ingredient.objects.values_list('name', flat=True).first()
+    if name is not None:
+        paths.append(f'/api/ingredients/?name={name[:2]}')
+    return paths
+
+
+def run_wsgi(path, requests, concurrency):
+    from django.test import Client
+
+    def worker(count):
+        client = Client()
+        for _ in range(count):
+            assert client.get(path).status_code == 200
+
+    counts = [requests // concurrency] * concurrency
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, counts))
+    return sum(counts)
+
+
+def run_asgi(path, requests, concurrency):
+    from django.test import AsyncClient
+
+    async def worker(count):
+        client = AsyncClient()
+        for _ in range(count):
+            response = await client.get(path)
+            assert response.status_code == 200
+
+    async def main(counts):
+        await asyncio.gather(*(worker(count) for count in counts))
+
+    counts = [requests // concurrency] * concurrency
+    asyncio.run(main(counts))
+    return sum(counts)
+
+
+def run_mode(mode, requests, concurrency):
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+    django.setup()
+    run = run_wsgi if mode == 'wsgi' else run_asgi
+    results = {}
+    for path in get_paths():
+        run(path, concurrency, concurrency)
+        started = time.perf_counter()
+        done = run(path, requests, concurrency)
+        results[path] = round(done / (time.perf_counter() - started), 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--mode', choices=MODES)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=10)
+    args = parser.parse_args()
+    if args.mode:
+        print(json.dumps(
+            run_mode(args.mode, args.requests, args.concurrency)
+        ))
+        return
+    results = {}
+    for mode, async_views in MODES.items():
+        output = subprocess.run(
+            [
+                sys.executable, '-m', 'benchmarks.asgi_vs_wsgi',
+                '--mode', mode,
+                '--requests', str(args.requests),
+                '--concurrency', str(args.concurrency),
+            ],
+            env={**os.environ, 'ASYNC_VIEWS': async_views},
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        results[mode] = json.loads(output.splitlines()[-1])
+    print(f'{"запрос/с":<40}' + ''.join(f'{mode:>12}' for mode in MODES))
+    for path in results['wsgi']:
+        print(f'{path:<40}' + ''.join(
+            f'{results[mode].get(path, 0):>12}' for mode in MODES
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Синтетический набор данных для нагрузочных тестов."""
+import random
+from contextlib import contextmanager
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import transaction
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+from recipes.models import (FavoriteRecipe, Ingredient, IngredientInRecipe,
+                            Recipe, ShoppingCart, Tag)
+from recipes.utils import bulk_create_with_pks
+from rest_framework.authtoken.models import Token
+from users.models import Follow
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+IMAGE = 'recipes/images/benchmark.png'
+
+
+@contextmanager
+def test_database():
+    """Отдельная тестовая база на время замеров"""
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        yield
+    finally:
+        runner.teardown_databases(old_config)
+        teardown_test_environment()
+
+
+def sample(rng, population, count):
+    return rng.sample(population, min(count, len(population)))
+
+
+@transaction.atomic
+def seed_dataset(users=50, recipes_per_user=10, ingredients_per_recipe=8,
+                 follows_per_user=10, favorites_per_user=20, cart_per_user=5,
+                 seed=42):
+    """Заполняет базу и возвращает описание набора с токенами и id"""
+    rng = random.Random(seed)
+    if not Ingredient.objects.exists():
+        call_command('load_ingredients', stdout=StringIO())
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+    tag_ids = list(Tag.objects.values_list('id', flat=True))
+    password = make_password(None)
+
+    authors = bulk_create_with_pks(User, [
+        User(
+            username=f'bench{seed}_{number}',
+            email=f'bench{seed}_{number}@example.com',
+            first_name='Бенчмарк',
+            last_name=str(number),
+            password=password,
+        )
+        for number in range(users)
+    ], batch_size=BATCH_SIZE)
+    user_ids = [user.id for user in authors]
+    tokens = Token.objects.bulk_create([
+        Token(key=Token.generate_key(), user_id=user_id)
+        for user_id in user_ids
+    ], batch_size=BATCH_SIZE)
+
+    recipes = bulk_create_with_pks(Recipe, [
+        Recipe(
+            author_id=user_id,
+            name=f'Рецепт {user_id}-{number}',
+            text='Синтетический рецепт для нагрузочного теста. ' * 5,
+            cooking_time=rng.randint(5, 180),
+            image=IMAGE,
+        )
+        for user_id in user_ids
+        for number in range(recipes_per_user)
+    ], batch_size=BATCH_SIZE)
+    recipe_ids = [recipe.id for recipe in recipes]
+
+    Recipe.tags.through.objects.bulk_create([
+        Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+        for recipe_id in recipe_ids
+        for tag_id in sample(rng, tag_ids, rng.randint(1, 3))
+    ], batch_size=BATCH_SIZE)
+    IngredientInRecipe.objects.bulk_create([
+        IngredientInRecipe(
+            recipe_id=recipe_id,
+            ingredient_id=ingredient_id,
+            amount=rng.randint(1, 500),
+        )
+        for recipe_id in recipe_ids
+        for ingredient_id in sample(
+            rng, ingredient_ids, ingredients_per_recipe
+        )
+    ], batch_size=BATCH_SIZE)
+
+    Follow.objects.bulk_create([
+        Follow(user_id=user_id, author_id=author_id)
+        for user_id in user_ids
+        for author_id in sample(rng, user_ids, follows_per_user + 1)
+        if author_id != user_id
+    ], batch_size=BATCH_SIZE)
+    for model, count in (
+        (FavoriteRecipe, favorites_per_user),
+        (ShoppingCart, cart_per_user),
+    ):
+        model.objects.bulk_create([
+            model(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in sample(rng, recipe_ids, count)
+        ], batch_size=BATCH_SIZE)
+    call_command('rebuild_shopping_lists', users=user_ids, stdout=StringIO())
+    call_command('reconcile_counters', stdout=StringIO())
+    call_command('rebuild_feed', users=user_ids, stdout=StringIO())
+
+    return {
+        'users': users,
+        'recipes': len(recipe_ids),
+        'tokens': [token.key for token in tokens],
+        'user_ids': user_ids,
+        'recipe_ids': recipe_ids,
+        'tag_slugs': list(Tag.objects.values_list('slug', flat=True)),
+        'ingredient_names': list(Ingredient.objects.filter(
+            id__in=sample(rng, ingredient_ids, 50)
+        ).values_list('name', flat=True)),
+    }
@@ -0,0 +1,648 @@
+"""Проверка бюджета SQL-запросов по эндпоинтам API.
+
+Запуск из каталога backend:
+
+    python -m benchmarks.query_budgets
+
+Маршруты из api/urls.py вызываются на тестовой базе с наборами
+разного размера: страницы списков, число ингредиентов рецепта, число id
+в пакетных запросах. Токен уже в кэше аутентификации, как у клиента,
+который продолжает работу. Отдельно проверяется, что с токеном в кэше
+GET-запросы не читают токены, а без него платят за это одним запросом,
+и что повторный запрос рецептов отдаёт их представление из кэша, не
+вызывая сериализатор. Число запросов не должно зависеть от размера
+и не должно превышать бюджет. SELECT-запросы горячих эндпоинтов дополнительно
+проверяются через EXPLAIN: поиск по таблицам, растущим вместе с данными,
+должен идти по индексу. Не проверяются маршруты, которые в текущей
+настройке djoser не работают: reset_password, reset_username и
+resend_activation (не заданы ссылки в письмах и отправка активации),
+set_username и reset_username_confirm (ошибка djoser 2.1 с полем
+new_username). Для частичной правки ингредиентов рецепта
+проверяется и число изменяющих запросов к таблице ингредиентов: без
+изменений их нет, новые количества пишутся одним запросом. При нарушениях
+команда завершается с кодом 1. Те же проверки выполняет
+benchmarks/tests.py в составе python manage.py test.
+"""
+import argparse
+import base64
+import os
+import re
+import sys
+import tempfile
+from collections import Counter, namedtuple
+from io import BytesIO
+
+import django
+
+Case = namedtuple(
+    'Case',
+    'name method path budget sizes body anonymous explain writes cached',
+    defaults=((1,), None, False, False, None, False),
+)
+
+PAGE_SIZES = (1, 3, 10)
+DATASET = {
+    'users': 24, 'recipes_per_user': 12, 'follows_per_user': 10,
+    'favorites_per_user': 12, 'cart_per_user': 12,
+}
+# Фоновая работа выполняется сразу, чтобы замер был воспроизводимым.
+SETTINGS = {
+    'RECIPE_IMAGE_VARIANTS_ASYNC': False,
+    'INGREDIENT_INDEX_REFRESH_ASYNC': False,
+}
+PASSWORD = 'Budget-password-1'
+SKIPPED_STATEMENTS = (
+    'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT',
+)
+# Таблицы, которые растут вместе с пользователями и рецептами.
+HOT_TABLES = {
+    'auth_user',
+    'authtoken_token',
+    'recipes_recipe',
+    'recipes_recipe_tags',
+    'recipes_ingredientinrecipe',
+    'recipes_favoriterecipe',
+    'recipes_shoppingcart',
+    'recipes_shoppinglistitem',
+    'users_follow',
+}
+FULL_SCANS = {
+    'sqlite': re.compile(r'^SCAN (?:TABLE )?(\w+)$'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+}
+PAGE_LIMIT = re.compile(r'\bLIMIT \d+(?: OFFSET \d+)?$')
+WRITE = re.compile(r'^(?:INSERT INTO|UPDATE|DELETE FROM) "(\w+)"')
+SORTS = {
+    'sqlite': re.compile(r'USE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY'),
+    'postgresql': re.compile(r'^\s*(?:->\s*)?Sort\b'),
+}
+
+
+def png_base64():
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new('RGB', (2, 2), 'white').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+def recipe_body(data, size):
+    return {
+        'name': 'Проверка бюджета',
+        'text': 'Рецепт для проверки числа запросов',
+        'cooking_time': 10,
+        'image': data['image'],
+        'tags': data['tag_ids'][:2],
+        'ingredients': [
+            {'id': ingredient_id, 'amount': 10}
+            for ingredient_id in data['ingredient_ids'][:size]
+        ],
+    }
+
+
+def ingredients_body(changed):
+    """Текущие ингредиенты своего рецепта, у первых size — новое количество"""
+    def body(data, size):
+        count = size if changed else 0
+        return {'ingredients': [
+            {'id': ingredient_id, 'amount': amount + (number < count)}
+            for number, (ingredient_id, amount) in enumerate(
+                data['own_ingredients']
+            )
+        ]}
+    return body
+
+
+def ids_body(ids):
+    return lambda data, size: {'ids': data[ids][:size]}
+
+
+CASES = (
+    Case('api_root', 'get', '/api/', 0),
+    Case('tags_list', 'get', '/api/tags/', 2),
+    Case('tags_detail', 'get', '/api/tags/{tag}/', 1),
+    Case('ingredients_list', 'get', '/api/ingredients/?name={prefix}', 0),
+    Case('ingredients_detail', 'get', '/api/ingredients/{ingredient}/', 1),
+    Case(
+        'recipes_list', 'get', '/api/recipes/?limit={size}', 4,
+        PAGE_SIZES, explain=True,
+        cached=True,
+    ),
+    Case(
+        'recipes_list_anonymous', 'get', '/api/recipes/?limit={size}', 4,
+        PAGE_SIZES, anonymous=True, explain=True,
+        cached=True,
+    ),
+    Case(
+        'recipes_list_cursor', 'get',
+        '/api/recipes/?pagination=cursor&limit={size}', 3,
+        PAGE_SIZES, explain=True,
+        cached=True,
+    ),
+    Case(
+        'recipes_list_favorited', 'get',
+        '/api/recipes/?is_favorited=1&limit={size}', 4,
+        PAGE_SIZES, explain=True,
+        cached=True,
+    ),
+    Case(
+        'recipes_list_in_cart', 'get',
+        '/api/recipes/?is_in_shopping_cart=1&limit={size}', 4,
+        PAGE_SIZES, explain=True,
+        cached=True,
+    ),
+    Case(
+        'recipes_list_tags', 'get',
+        '/api/recipes/?tags={tag_slug}&limit={size}', 4,
+        PAGE_SIZES, explain=True,
+        cached=True,
+    ),
+    Case(
+        'recipes_list_author', 'get',
+        '/api/recipes/?author={author}&limit={size}', 4,
+        PAGE_SIZES, explain=True,
+        cached=True,
+    ),
+    Case(
+        'recipes_feed', 'get', '/api/recipes/feed/?limit={size}', 5,
+        PAGE_SIZES, explain=True,
+        cached=True,
+    ),
+    Case(
+        'recipes_detail', 'get', '/api/recipes/{recipe}/', 3, explain=True,
+        cached=True,
+    ),
+    Case(
+        'recipes_detail_anonymous', 'get', '/api/recipes/{recipe}/', 3,
+        anonymous=True, explain=True, cached=True,
+    ),
+    Case(
+        'recipes_create', 'post', '/api/recipes/', 13, (1, 5, 10),
+        recipe_body,
+    ),
+    Case(
+        'recipes_update', 'patch', '/api/recipes/{own_recipe}/', 20,
+        (1, 5, 10), recipe_body,
+    ),
+    Case(
+        'recipes_update_same_ingredients', 'patch',
+        '/api/recipes/{own_recipe}/', 10, body=ingredients_body(False),
+        writes={'recipes_ingredientinrecipe': 0},
+    ),
+    Case(
+        'recipes_update_ingredient_amounts', 'patch',
+        '/api/recipes/{own_recipe}/', 12, (1, 3, 8), ingredients_body(True),
+        writes={'recipes_ingredientinrecipe': 1},
+    ),
+    Case(
+        'recipes_replace', 'put', '/api/recipes/{own_recipe}/', 20,
+        (1, 5, 10), recipe_body,
+    ),
+    Case('recipes_delete', 'delete', '/api/recipes/{own_recipe}/', 13),
+    Case('favorite_add', 'post', '/api/recipes/{other_recipe}/favorite/', 3),
+    Case(
+        'favorite_delete', 'delete',
+        '/api/recipes/{favorite_recipe}/favorite/', 2,
+    ),
+    Case(
+        'shopping_cart_add', 'post',
+        '/api/recipes/{other_recipe}/shopping_cart/', 7,
+    ),
+    Case(
+        'shopping_cart_delete', 'delete',
+        '/api/recipes/{cart_recipe}/shopping_cart/', 5,
+    ),
+    Case(
+        'batch_favorite_add', 'post', '/api/recipes/batch_favorite/', 3,
+        PAGE_SIZES, ids_body('other_recipes'),
+    ),
+    Case(
+        'batch_favorite_delete', 'delete', '/api/recipes/batch_favorite/', 3,
+        PAGE_SIZES, ids_body('favorites'),
+    ),
+    Case(
+        'batch_shopping_cart_add', 'post',
+        '/api/recipes/batch_shopping_cart/', 8,
+        PAGE_SIZES, ids_body('other_recipes'),
+    ),
+    Case(
+        'batch_shopping_cart_delete', 'delete',
+        '/api/recipes/batch_shopping_cart/', 7,
+        PAGE_SIZES, ids_body('cart'),
+    ),
+    Case(
+        'download_shopping_cart', 'get',
+        '/api/recipes/download_shopping_cart/', 1, explain=True,
+    ),
+    Case(
+        'users_list', 'get', '/api/users/?limit={size}', 2,
+        PAGE_SIZES, explain=True,
+    ),
+    Case(
+        'users_list_anonymous', 'get', '/api/users/?limit={size}', 2,
+        PAGE_SIZES, anonymous=True,
+    ),
+    Case('users_detail', 'get', '/api/users/{author}/', 1, explain=True),
+    Case('users_me', 'get', '/api/users/me/', 1),
+    Case(
+        'users_create', 'post', '/api/users/', 3, anonymous=True,
+        body=lambda data, size: {
+            'email': 'budget@example.com',
+            'username': 'budget',
+            'first_name': 'Бюджет',
+            'last_name': 'Запросов',
+            'password': PASSWORD,
+        },
+    ),
+    Case(
+        'set_password', 'post', '/api/users/set_password/', 2,
+        body=lambda data, size: {
+            'current_password': PASSWORD,
+            'new_password': PASSWORD[::-1],
+        },
+    ),
+    Case(
+        'reset_password_confirm', 'post',
+        '/api/users/reset_password_confirm/', 3, anonymous=True,
+        body=lambda data, size: {
+            **data['reset'], 'new_password': PASSWORD[::-1],
+        },
+    ),
+    Case(
+        'activation', 'post', '/api/users/activation/', 3, anonymous=True,
+        body=lambda data, size: data['activation'],
+    ),
+    *(
+        Case(
+            f'users_{name}_{method}', method, path, budget,
+            body=lambda data, size: {
+                'email': 'budget_renamed@example.com',
+                'username': 'budget_renamed',
+                'first_name': 'Бюджет',
+                'last_name': 'Запросов',
+            },
+        )
+        for name, path, budget in (
+            ('me', '/api/users/me/', 4), ('own', '/api/users/{user}/', 5),
+        )
+        for method in ('put', 'patch')
+    ),
+    *(
+        Case(
+            f'users_{name}_delete', 'delete', path, budget,
+            body=lambda data, size: {'current_password': PASSWORD},
+        )
+        for name, path, budget in (
+            ('me', '/api/users/me/', 26), ('own', '/api/users/{user}/', 27),
+        )
+    ),
+    Case(
+        'subscriptions', 'get',
+        '/api/users/subscriptions/?limit={size}&recipes_limit=3', 3,
+        PAGE_SIZES, explain=True,
+    ),
+    Case(
+        'subscriptions_all_recipes', 'get',
+        '/api/users/subscriptions/?limit={size}', 3,
+        PAGE_SIZES, explain=True,
+    ),
+    Case('subscribe', 'post', '/api/users/{unfollowed_author}/subscribe/', 5),
+    Case(
+        'unsubscribe', 'delete', '/api/users/{followed_author}/subscribe/', 3,
+    ),
+    Case(
+        'batch_subscribe', 'post', '/api/users/batch_subscribe/', 4,
+        PAGE_SIZES, ids_body('unfollowed'),
+    ),
+    Case(
+        'batch_unsubscribe', 'delete', '/api/users/batch_subscribe/', 4,
+        PAGE_SIZES, ids_body('followed'),
+    ),
+    Case(
+        'token_login', 'post', '/api/auth/token/login/', 3, anonymous=True,
+        body=lambda data, size: {
+            'email': data['email'], 'password': PASSWORD,
+        },
+    ),
+    Case('token_logout', 'post', '/api/auth/token/logout/', 2),
+)
+
+
+class QueryRecorder:
+    """Запросы, выполненные внутри представления, без точек сохранения"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.startswith(SKIPPED_STATEMENTS):
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def prepare_data(dataset):
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.tokens import default_token_generator
+    from djoser.utils import encode_uid
+    from recipes.ingredient_index import ingredient_index
+    from recipes.models import Ingredient, Recipe, Tag
+    from rest_framework.authtoken.models import Token
+
+    # Индекс ингредиентов загружается при запуске процесса.
+    ingredient_index.warm()
+    user = get_user_model().objects.get(pk=dataset['user_ids'][0])
+    user.set_password(PASSWORD)
+    user.save(update_fields=('password',))
+    followed = sorted(user.follower.values_list('author_id', flat=True))
+    favorites = sorted(user.favorites.values_list('recipe_id', flat=True))
+    cart = sorted(user.cart.values_list('recipe_id', flat=True))
+    other_recipes = list(Recipe.objects.exclude(author=user).exclude(
+        id__in=[*favorites, *cart]
+    ).values_list('id', flat=True).order_by('id'))
+    unfollowed = [
+        pk for pk in dataset['user_ids'][1:] if pk not in followed
+    ]
+    own_recipe = user.recipes.order_by('id').first()
+    inactive = get_user_model().objects.create_user(
+        username='budget_inactive',
+        email='budget_inactive@example.com',
+        password=PASSWORD,
+        is_active=False,
+    )
+    tag = Tag.objects.first()
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True)[:10])
+    return {
+        'token': Token.objects.get(user=user).key,
+        'user': user.id,
+        'reset': {
+            'uid': encode_uid(user.pk),
+            'token': default_token_generator.make_token(user),
+        },
+        'activation': {
+            'uid': encode_uid(inactive.pk),
+            'token': default_token_generator.make_token(inactive),
+        },
+        'email': user.email,
+        'tag': tag.id,
+        'tag_slug': tag.slug,
+        'tag_ids': list(Tag.objects.values_list('id', flat=True)),
+        'ingredient': ingredient_ids[0],
+        'ingredient_ids': ingredient_ids,
+        'prefix': dataset['ingredient_names'][0][:3],
+        'recipe': dataset['recipe_ids'][-1],
+        'own_recipe': own_recipe.id,
+        'own_ingredients': list(own_recipe.ingredients_amount.values_list(
+            'ingredient_id', 'amount'
+        ).order_by('id')),
+        'other_recipe': other_recipes[0],
+        'other_recipes': other_recipes,
+        'favorite_recipe': favorites[0],
+        'favorites': favorites,
+        'cart_recipe': cart[0],
+        'cart': cart,
+        'author': unfollowed[0],
+        'unfollowed_author': unfollowed[0],
+        'unfollowed': unfollowed,
+        'followed_author': followed[0],
+        'followed': followed,
+        'image': png_base64(),
+    }
+
+
+def run_case(case, data, size, cached_token=True):
+    """Выполняет запрос с откатом изменений и возвращает его SQL.
+
+    При cached_token=False токена нет в кэше аутентификации.
+    """
+    from api.authentication import CachedTokenAuthentication, token_cache
+    from django.db import connection, transaction
+    from rest_framework.test import APIClient
+
+    client = APIClient()
+    token_cache.clear()
+    if not case.anonymous:
+        client.credentials(HTTP_AUTHORIZATION=f'Token {data["token"]}')
+        if cached_token:
+            CachedTokenAuthentication().authenticate_credentials(
+                data['token']
+            )
+    path = case.path.format(size=size, **data)
+    body = case.body(data, size) if case.body else None
+    recorder = QueryRecorder()
+    with transaction.atomic():
+        with connection.execute_wrapper(recorder):
+            response = getattr(client, case.method)(path, body, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+        transaction.set_rollback(True)
+    if response.status_code >= 400:
+        raise AssertionError(
+            f'{case.method.upper()} {path}: {response.status_code} '
+            f'{getattr(response, "data", "")}'
+        )
+    return recorder.queries
+
+
+def explain(sql, params):
+    from django.db import connection, transaction
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}', params)
+        else:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [str(row[-1]) for row in cursor.fetchall()]
+
+
+def plan_problems(sql, params):
+    """Полные просмотры растущих таблиц и сортировки страниц без индекса.
+
+    Последовательный просмотр считается проблемой, только если запрос
+    фильтрует строки и не ограничен страницей: страница без сортировки
+    читает таблицу лишь до LIMIT.
+    """
+    from django.db import connection
+
+    full_scan = FULL_SCANS.get(connection.vendor)
+    if full_scan is None or not sql.startswith('SELECT'):
+        return []
+    sort = SORTS[connection.vendor]
+    page = PAGE_LIMIT.search(sql)
+    aliases = {
+        alias: table for table, alias in re.findall(r'"(\w+)" (U\d+)', sql)
+    }
+    problems = []
+    for line in explain(sql, params):
+        match = full_scan.search(line.strip())
+        if match:
+            table = aliases.get(match.group(1), match.group(1))
+            if table in HOT_TABLES and ' WHERE ' in sql and not page:
+                problems.append(line.strip())
+        elif page and sort.search(line):
+            problems.append(line.strip())
+    return problems
+
+
+def write_errors(case, queries, size):
+    """Расхождения числа изменяющих запросов к таблицам из case.writes"""
+    written = Counter(
+        match.group(1)
+        for match in (WRITE.match(sql) for sql, _ in queries)
+        if match
+    )
+    return [
+        f'[{size}] изменений {table}: {written[table]}, ожидалось {expected}'
+        for table, expected in (case.writes or {}).items()
+        if written[table] != expected
+    ]
+
+
+def measure(case, data, use_explain, verbosity):
+    """Число запросов по размерам, проблемные планы и лишние изменения"""
+    counts = {}
+    problems = {}
+    writes = []
+    for size in case.sizes:
+        queries = run_case(case, data, size)
+        counts[size] = len(queries)
+        writes.extend(write_errors(case, queries, size))
+        if verbosity > 1:
+            print(f'{case.name} [{size}]:')
+            for sql, _ in queries:
+                print(f'    {sql[:300]}')
+        if use_explain and case.explain:
+            for sql, params in queries:
+                for problem in plan_problems(sql, params):
+                    problems.setdefault(problem, sql)
+    return counts, problems, writes
+
+
+def case_errors(case, data, use_explain=True, verbosity=0):
+    """Замеры эндпоинта и список нарушений бюджета, пустой если их нет"""
+    counts, problems, errors = measure(case, data, use_explain, verbosity)
+    if len(set(counts.values())) > 1:
+        errors.append(f'число запросов зависит от размера: {counts}')
+    if max(counts.values()) > case.budget:
+        errors.append(
+            f'{max(counts.values())} запросов при бюджете {case.budget}'
+        )
+    errors.extend(
+        f'без индекса: {problem}\n      {sql[:300]}'
+        for problem, sql in problems.items()
+    )
+    return counts, errors
+
+
+def token_cache_errors(case, data):
+    """Нарушения кэша аутентификации для GET-запроса с токеном.
+
+    С токеном в кэше запрос не читает authtoken_token, без него
+    токен с пользователем загружается одним дополнительным запросом.
+    """
+    if case.anonymous or case.method != 'get':
+        return []
+    size = case.sizes[0]
+    cached = run_case(case, data, size)
+    errors = [
+        f'запрос токена при токене в кэше: {sql[:300]}'
+        for sql, _ in cached if '"authtoken_token"' in sql
+    ]
+    missed = run_case(case, data, size, cached_token=False)
+    if len(missed) != len(cached) + 1:
+        errors.append(
+            f'без токена в кэше {len(missed)} запросов, '
+            f'ожидалось {len(cached) + 1}'
+        )
+    return errors
+
+
+def recipe_cache_errors(case, data):
+    """Нарушения кэша представлений рецептов для case.cached.
+
+    Повторный запрос берёт общую часть рецептов из кэша: сериализатор
+    не вызывается, а запросов не больше, чем при пустом кэше.
+    """
+    from unittest import mock
+
+    from api import serializers
+    from api.cache import recipe_cache
+
+    if not case.cached or recipe_cache.cache is None:
+        return []
+    size = case.sizes[-1]
+    recipe_cache.cache.clear()
+    empty = run_case(case, data, size)
+    with mock.patch.object(
+        serializers, 'RecipeSharedSerializer',
+        wraps=serializers.RecipeSharedSerializer,
+    ) as serializer:
+        filled = run_case(case, data, size)
+    errors = []
+    if serializer.called:
+        errors.append('представление рецептов построено при полном кэше')
+    if len(filled) > len(empty):
+        errors.append(
+            f'с кэшем {len(filled)} запросов, без кэша {len(empty)}'
+        )
+    return errors
+
+
+def cache_errors(case, data):
+    """Нарушения кэшей аутентификации и представлений рецептов"""
+    return token_cache_errors(case, data) + recipe_cache_errors(case, data)
+
+
+def check(cases, data, use_explain, verbosity):
+    failures = []
+    for case in cases:
+        counts, errors = case_errors(case, data, use_explain, verbosity)
+        errors.extend(cache_errors(case, data))
+        status = 'FAIL' if errors else 'ok'
+        if errors or verbosity:
+            print(f'{status:4} {case.name}: {counts} / {case.budget}')
+        for error in errors:
+            print(f'     {error}')
+        if errors:
+            failures.append(case.name)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--case', action='append', dest='cases',
+        help='Проверить только указанные эндпоинты',
+    )
+    parser.add_argument(
+        '--no-explain', action='store_true',
+        help='Не проверять планы запросов',
+    )
+    parser.add_argument('-v', '--verbosity', type=int, default=1)
+    args = parser.parse_args(argv)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+    django.setup()
+
+    from django.test.utils import override_settings
+
+    from .dataset import seed_dataset, test_database
+
+    cases = [
+        case for case in CASES if not args.cases or case.name in args.cases
+    ]
+    with tempfile.TemporaryDirectory() as media_root, override_settings(
+        MEDIA_ROOT=media_root, **SETTINGS,
+    ), test_database():
+        dataset = seed_dataset(**DATASET)
+        failures = check(
+            cases, prepare_data(dataset), not args.no_explain, args.verbosity
+        )
+    if failures:
+        sys.exit(f'Превышен бюджет запросов: {", ".join(failures)}')
+    print(f'Проверено эндпоинтов: {len(cases)}')
+
+
+if __name__ == '__main__':
+    main()
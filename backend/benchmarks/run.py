@@ -0,0 +1,231 @@
+"""Нагрузочный тест основных эндпоинтов API.
+
+Запуск из каталога backend:
+
+    python -m benchmarks.run --users 50 --requests 400 --concurrency 8 \\
+        --output result.json
+
+По умолчанию создаётся отдельная тестовая база, заполняется через
+benchmarks.dataset, а запросы идут через django.test.Client в потоках.
+С --base-url запросы отправляются на запущенный сервер: набор данных
+записывается в базу из настроек, с которой должен работать сервер.
+Число SQL-запросов в этом режиме берётся из заголовка Server-Timing
+(SERVER_TIMING=True на сервере). На SQLite параллельные записи
+(favorite_toggle) частично упираются в блокировки базы и считаются
+ошибками.
+
+Результат — JSON с p50/p95/p99, пропускной способностью и числом
+SQL-запросов на запрос по каждому сценарию.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import django
+
+SQL_COUNT = re.compile(r'desc="(\d+) SQL"')
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class TestClientDriver:
+    """Запросы через тестовый клиент Django в текущем процессе"""
+
+    def __init__(self, token):
+        from django.test import Client
+
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+
+    def request(self, method, path):
+        from django.db import connection
+
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = getattr(self.client, method)(path)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return response.status_code, counter.count
+
+    def close(self):
+        from django.db import connection
+
+        connection.close()
+
+
+class HTTPDriver:
+    """Запросы на запущенный сервер по HTTP"""
+
+    def __init__(self, token, base_url):
+        self.token = token
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path):
+        request = urllib.request.Request(
+            self.base_url + path,
+            method=method.upper(),
+            headers={'Authorization': f'Token {self.token}'},
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                status, headers = response.status, response.headers
+        except urllib.error.HTTPError as error:
+            status, headers = error.code, error.headers
+        match = SQL_COUNT.search(headers.get('Server-Timing', ''))
+        return status, int(match.group(1)) if match else None
+
+    def close(self):
+        pass
+
+
+def percentile(cuts, value):
+    return round(cuts[value - 1] * 1000, 2) if cuts else None
+
+
+def run_worker(make_driver, scenario, data, token, seed, count):
+    driver = make_driver(token)
+    requests = scenario(random.Random(seed), data)
+    samples = []
+    try:
+        for _ in range(count):
+            method, path = next(requests)
+            started = time.perf_counter()
+            try:
+                status, queries = driver.request(method, path)
+            except Exception as error:
+                status, queries = type(error).__name__, None
+            samples.append((time.perf_counter() - started, status, queries))
+    finally:
+        driver.close()
+    return samples
+
+
+def run_scenario(make_driver, scenario, data, args):
+    counts = [args.requests // args.concurrency] * args.concurrency
+    tokens = data['tokens']
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = executor.map(
+            lambda worker: run_worker(
+                make_driver, scenario, data,
+                tokens[worker % len(tokens)],
+                args.seed + worker,
+                counts[worker],
+            ),
+            range(args.concurrency),
+        )
+        samples = [sample for result in results for sample in result]
+    elapsed = time.perf_counter() - started
+    latencies = [latency for latency, _, _ in samples]
+    queries = [count for _, _, count in samples if count is not None]
+    cuts = (
+        statistics.quantiles(latencies, n=100, method='inclusive')
+        if len(latencies) > 1 else []
+    )
+    return {
+        'requests': len(samples),
+        'errors': sum(
+            1 for _, status, _ in samples
+            if not isinstance(status, int) or status >= 500
+        ),
+        'statuses': dict(Counter(str(status) for _, status, _ in samples)),
+        'throughput_rps': round(len(samples) / elapsed, 1),
+        'p50_ms': percentile(cuts, 50),
+        'p95_ms': percentile(cuts, 95),
+        'p99_ms': percentile(cuts, 99),
+        'queries_per_request': (
+            round(statistics.mean(queries), 2) if queries else None
+        ),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--recipes-per-user', type=int, default=10)
+    parser.add_argument('--follows-per-user', type=int, default=10)
+    parser.add_argument('--favorites-per-user', type=int, default=20)
+    parser.add_argument('--cart-per-user', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument(
+        '--scenario', action='append', dest='scenarios',
+        help='Запустить только указанные сценарии',
+    )
+    parser.add_argument('--base-url', help='Адрес запущенного сервера')
+    parser.add_argument('--output', help='Файл для JSON-результата')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+    django.setup()
+
+    from .dataset import seed_dataset, test_database
+    from .scenarios import SCENARIOS
+
+    scenarios = args.scenarios or list(SCENARIOS)
+    unknown = set(scenarios) - SCENARIOS.keys()
+    if unknown:
+        sys.exit(f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+
+    if args.base_url:
+        def make_driver(token):
+            return HTTPDriver(token, args.base_url)
+    else:
+        make_driver = TestClientDriver
+    with nullcontext() if args.base_url else test_database():
+        started = time.perf_counter()
+        data = seed_dataset(
+            users=args.users,
+            recipes_per_user=args.recipes_per_user,
+            follows_per_user=args.follows_per_user,
+            favorites_per_user=args.favorites_per_user,
+            cart_per_user=args.cart_per_user,
+            seed=args.seed,
+        )
+        seed_time = time.perf_counter() - started
+        report = {
+            'config': {
+                key: value for key, value in vars(args).items()
+                if key not in ('output', 'scenarios')
+            },
+            'dataset': {
+                'users': data['users'],
+                'recipes': data['recipes'],
+                'seed_seconds': round(seed_time, 2),
+            },
+            'results': {
+                name: run_scenario(make_driver, SCENARIOS[name], data, args)
+                for name in scenarios
+            },
+        }
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
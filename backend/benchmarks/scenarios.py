@@ -0,0 +1,62 @@
+"""Сценарии нагрузки: генераторы пар (метод, путь) для одного клиента."""
+from urllib.parse import quote, urlencode
+
+
+def recipe_list(rng, data):
+    while True:
+        yield 'get', f'/api/recipes/?page={rng.randint(1, 5)}&limit=6'
+
+
+def recipe_list_filtered(rng, data):
+    while True:
+        params = [('tags', slug) for slug in rng.sample(data['tag_slugs'], 2)]
+        params.append(('is_favorited', rng.choice(('0', '1'))))
+        yield 'get', f'/api/recipes/?{urlencode(params)}'
+
+
+def recipe_list_author(rng, data):
+    while True:
+        yield 'get', f'/api/recipes/?author={rng.choice(data["user_ids"])}'
+
+
+def recipe_detail(rng, data):
+    while True:
+        yield 'get', f'/api/recipes/{rng.choice(data["recipe_ids"])}/'
+
+
+def subscriptions(rng, data):
+    while True:
+        yield 'get', '/api/users/subscriptions/?recipes_limit=3'
+
+
+def download_shopping_cart(rng, data):
+    while True:
+        yield 'get', '/api/recipes/download_shopping_cart/'
+
+
+def ingredient_search(rng, data):
+    while True:
+        name = rng.choice(data['ingredient_names'])
+        yield 'get', f'/api/ingredients/?name={quote(name[:3])}'
+
+
+def favorite_toggle(rng, data):
+    while True:
+        path = f'/api/recipes/{rng.choice(data["recipe_ids"])}/favorite/'
+        yield 'post', path
+        yield 'delete', path
+
+
+SCENARIOS = {
+    scenario.__name__: scenario
+    for scenario in (
+        recipe_list,
+        recipe_list_filtered,
+        recipe_list_author,
+        recipe_detail,
+        subscriptions,
+        download_shopping_cart,
+        ingredient_search,
+        favorite_toggle,
+    )
+}
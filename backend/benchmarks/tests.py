@@ -0,0 +1,36 @@
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+
+from .dataset import seed_dataset
+from .query_budgets import (CASES, DATASET, SETTINGS, cache_errors,
+                            case_errors, prepare_data)
+
+
+class QueryBudgetTest(TestCase):
+    """Бюджеты SQL-запросов и планы из benchmarks/query_budgets.py"""
+
+    @classmethod
+    def setUpClass(cls):
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        overridden = override_settings(MEDIA_ROOT=media_root, **SETTINGS)
+        overridden.enable()
+        cls.addClassCleanup(overridden.disable)
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = prepare_data(seed_dataset(**DATASET))
+
+    def test_budgets(self):
+        for case in CASES:
+            with self.subTest(case.name):
+                counts, errors = case_errors(case, self.data)
+                self.assertEqual(errors, [], f'{counts} / {case.budget}')
+
+    def test_caches(self):
+        for case in CASES:
+            with self.subTest(case.name):
+                self.assertEqual(cache_errors(case, self.data), [])
@@ -0,0 +1,161 @@
+import heapq
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('foodgram.performance')
+
+SLOW_QUERIES_LOGGED = 3
+SQL_LOG_LENGTH = 500
+SECTIONS = ('serialize', 'render')
+
+current_timer = ContextVar('current_timer', default=None)
+
+
+class RequestTimer:
+    """Замеры одного запроса: SQL, сериализация, рендеринг и общее время.
+
+    Время разделов sections не включает SQL, выполненный внутри них.
+    """
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.finished = None
+        self.db_count = 0
+        self.db_time = 0.0
+        self.render_started = None
+        self.sections = defaultdict(float)
+        self.slow_queries = []
+
+    def record_query(self, duration, sql):
+        self.db_count += 1
+        self.db_time += duration
+        item = (duration, sql)
+        if len(self.slow_queries) < SLOW_QUERIES_LOGGED:
+            heapq.heappush(self.slow_queries, item)
+        else:
+            heapq.heappushpop(self.slow_queries, item)
+
+    def start_render(self, response):
+        self.render_started = perf_counter(), self.db_time
+        response.add_post_render_callback(self.finish_render)
+
+    def finish_render(self, response):
+        self.add_section('render', *self.render_started)
+
+    def add_section(self, name, started, db_time):
+        """Добавляет к разделу name время с момента started без SQL"""
+        self.sections[name] += max(
+            perf_counter() - started - (self.db_time - db_time), 0
+        )
+
+    @property
+    def total_time(self):
+        return (self.finished or perf_counter()) - self.started
+
+    def header(self):
+        total = self.total_time
+        app = max(total - self.db_time - sum(self.sections.values()), 0)
+        return ', '.join((
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_count} SQL"',
+            f'app;dur={app * 1000:.1f}',
+            *(
+                f'{name};dur={self.sections[name] * 1000:.1f}'
+                for name in SECTIONS
+            ),
+            f'total;dur={total * 1000:.1f}',
+        ))
+
+
+@contextmanager
+def timed(section):
+    """Учитывает время блока в разделе section текущего запроса.
+
+    Замер передаётся через ContextVar, поэтому работает и в потоках
+    async-представлений; вне запроса блок просто выполняется.
+    """
+    timer = current_timer.get()
+    if timer is None:
+        yield
+        return
+    started, db_time = perf_counter(), timer.db_time
+    try:
+        yield
+    finally:
+        timer.add_section(section, started, db_time)
+
+
+def record_query(execute, sql, params, many, context):
+    timer = current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.record_query(perf_counter() - started, sql)
+
+
+def install_query_wrapper(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class ServerTimingMiddleware:
+    """Добавляет заголовок Server-Timing и пишет в лог медленные запросы.
+
+    Включается настройкой SERVER_TIMING; если она выключена, middleware
+    исключается из цепочки и ничего не стоит. SQL учитывается обёрткой
+    execute_wrapper на каждом соединении, поэтому запросы из потоков
+    async-представлений тоже попадают в замер.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        connection_created.connect(
+            install_query_wrapper, dispatch_uid='server_timing'
+        )
+        for connection in connections.all():
+            install_query_wrapper(connection)
+
+    def __call__(self, request):
+        timer = RequestTimer()
+        request.server_timing = timer
+        token = current_timer.set(timer)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        timer.finished = perf_counter()
+        response['Server-Timing'] = timer.header()
+        if timer.total_time * 1000 >= settings.SERVER_TIMING_SLOW_MS:
+            self.log_slow_request(request, timer)
+        return response
+
+    def process_template_response(self, request, response):
+        request.server_timing.start_render(response)
+        return response
+
+    def log_slow_request(self, request, timer):
+        queries = '\n'.join(
+            f'  {duration * 1000:.1f} ms: {sql[:SQL_LOG_LENGTH]}'
+            for duration, sql in sorted(timer.slow_queries, reverse=True)
+        )
+        logger.warning(
+            'Медленный запрос %s %s: %.1f ms, SQL: %d за %.1f ms\n%s',
+            request.method,
+            request.get_full_path(),
+            timer.total_time * 1000,
+            timer.db_count,
+            timer.db_time * 1000,
+            queries,
+        )
@@ -1,7 +1,27 @@
 from django.contrib import admin
+from django.db import transaction
+from users.models import AuthorStats
 
-from .models import (FavoriteRecipe, Ingredient, IngredientInRecipe, Recipe,
-                     ShoppingCart, Tag)
+from .models import (FavoriteRecipe, FeedEntry, Ingredient, IngredientInRecipe,
+                     Recipe, ShoppingCart, ShoppingListItem, Tag,
+                     before_recipes_delete)
+
+
+class ReadOnlyAdmin(admin.ModelAdmin):
+    """Только просмотр строк, от которых зависят итоги и счётчики.
+
+    Такие строки меняются через API, которое поддерживает их вместе
+    с зависящими данными.
+    """
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(Tag)
@@ -16,25 +36,63 @@ class IngredientAdmin(admin.ModelAdmin):
 
 
 @admin.register(IngredientInRecipe)
-class IngredientInRecipeAdmin(admin.ModelAdmin):
-    pass
+class IngredientInRecipeAdmin(ReadOnlyAdmin):
+    list_display = ('recipe', 'ingredient', 'amount')
+    list_select_related = ('recipe', 'ingredient')
 
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author')
+    list_display = ('name', 'author', 'favorites_count', 'in_carts_count')
     list_filter = ('name', 'author', 'tags')
-    readonly_fields = ('count_favorites',)
+    list_select_related = ('author',)
+    readonly_fields = ('favorites_count', 'in_carts_count')
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is None:
+            return self.readonly_fields
+        return (*self.readonly_fields, 'author')
 
-    def count_favorites(self, obj):
-        return obj.favorites.count()
+    @transaction.atomic()
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change:
+            AuthorStats.objects.change_counter(
+                'recipes_count', [obj.author_id], 1
+            )
+            FeedEntry.objects.fan_out([obj.id])
+
+    @transaction.atomic()
+    def delete_model(self, request, obj):
+        before_recipes_delete([obj.id])
+        super().delete_model(request, obj)
+
+    @transaction.atomic()
+    def delete_queryset(self, request, queryset):
+        before_recipes_delete(queryset.values('id'))
+        super().delete_queryset(request, queryset)
 
 
 @admin.register(FavoriteRecipe)
-class FavoriteRecipeAdmin(admin.ModelAdmin):
-    pass
+class FavoriteRecipeAdmin(ReadOnlyAdmin):
+    list_display = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
-    pass
+class ShoppingCartAdmin(ReadOnlyAdmin):
+    list_display = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'total')
+    list_filter = ('user',)
+
+
+@admin.register(FeedEntry)
+class FeedEntryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'recipe', 'author', 'pub_date')
+    list_select_related = ('user', 'recipe', 'author')
+    raw_id_fields = ('user', 'recipe', 'author')
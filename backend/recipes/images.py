@@ -0,0 +1,128 @@
+import logging
+import posixpath
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'variants'
+FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+
+
+def variant_name(name, variant):
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    extension = FORMAT_EXTENSIONS[
+        settings.RECIPE_IMAGE_VARIANTS[variant]['format']
+    ]
+    return posixpath.join(
+        directory, VARIANTS_DIR, f'{stem}_{variant}.{extension}'
+    )
+
+
+def recorded_variants(recipe):
+    """Имена готовых вариантов изображения рецепта по ключу варианта.
+
+    Список берётся из Recipe.image_variants, хранилище не опрашивается.
+    """
+    name = recipe.image.name
+    if not name:
+        return {}
+    return {
+        variant: variant_name(name, variant)
+        for variant in recipe.image_variants
+        if variant in settings.RECIPE_IMAGE_VARIANTS
+    }
+
+
+def existing_variants(name):
+    """Имена вариантов изображения, файлы которых есть в хранилище"""
+    if not name:
+        return {}
+    variants = {
+        variant: variant_name(name, variant)
+        for variant in settings.RECIPE_IMAGE_VARIANTS
+    }
+    return {
+        variant: path
+        for variant, path in variants.items()
+        if default_storage.exists(path)
+    }
+
+
+def generate_variants(name):
+    """Создаёт уменьшенные и WebP-варианты исходного изображения.
+
+    Возвращает список ключей созданных вариантов.
+    """
+    with default_storage.open(name) as source:
+        original = ImageOps.exif_transpose(Image.open(source))
+        original.load()
+    for variant, options in settings.RECIPE_IMAGE_VARIANTS.items():
+        image = original.copy()
+        if options.get('size'):
+            image.thumbnail(options['size'])
+        if options['format'] == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        buffer = BytesIO()
+        image.save(
+            buffer,
+            options['format'],
+            quality=options.get('quality', 80),
+            optimize=True,
+        )
+        target = variant_name(name, variant)
+        default_storage.delete(target)
+        default_storage.save(target, ContentFile(buffer.getvalue()))
+    return list(settings.RECIPE_IMAGE_VARIANTS)
+
+
+def record_variants(name, variants, recipe_id=None):
+    """Сохраняет готовые варианты в рецептах с изображением name"""
+    recipes = Recipe.objects.filter(image=name)
+    if recipe_id is not None:
+        recipes = recipes.filter(pk=recipe_id)
+    return recipes.update(image_variants=variants)
+
+
+def _generate_variants_logged(name, recipe_id):
+    try:
+        record_variants(name, generate_variants(name), recipe_id)
+    except Exception:
+        logger.exception('Не удалось создать варианты изображения %s', name)
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ProcessPoolExecutor(
+        max_workers=settings.RECIPE_IMAGE_WORKERS,
+        initializer=django.setup,
+    )
+
+
+def submit_variants(name, recipe_id):
+    try:
+        get_executor().submit(_generate_variants_logged, name, recipe_id)
+    except Exception:
+        logger.exception('Очередь обработки изображений недоступна')
+        get_executor.cache_clear()
+
+
+def schedule_variants(recipe):
+    """Ставит генерацию вариантов в фоновый процесс после коммита"""
+    name, recipe_id = recipe.image.name, recipe.id
+    if not settings.RECIPE_IMAGE_VARIANTS_ASYNC:
+        transaction.on_commit(
+            lambda: _generate_variants_logged(name, recipe_id)
+        )
+        return
+    transaction.on_commit(lambda: submit_variants(name, recipe_id))
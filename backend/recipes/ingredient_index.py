@@ -0,0 +1,140 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+from .models import Ingredient
+
+logger = logging.getLogger(__name__)
+
+Snapshot = namedtuple('Snapshot', 'loaded_at generation version keys items')
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Хранит отсортированные по casefold-имени записи и отвечает на запросы
+    без обращения к базе. Загружается при запуске процесса (warm),
+    а перечитывается в фоновом потоке после сигналов об изменении
+    Ingredient и не реже, чем раз в INGREDIENT_INDEX_TTL секунд, чтобы
+    подхватывать изменения из других процессов. Пока идёт загрузка,
+    запросы получают прежний снимок. В базу из запроса индекс идёт,
+    только если он не загрузился при запуске.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._snapshot = None
+        self._refreshing = False
+
+    def warm(self):
+        """Загружает индекс при запуске процесса, до первых запросов"""
+        try:
+            self._store(self._load())
+        except DatabaseError:
+            logger.exception('Индекс ингредиентов не загружен при запуске')
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+        self.refresh()
+
+    def refresh(self):
+        """Перечитывает индекс, в фоновом потоке не больше одной загрузки"""
+        if not settings.INGREDIENT_INDEX_REFRESH_ASYNC:
+            self._store(self._load())
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(
+            target=self._refresh_in_background, daemon=True
+        ).start()
+
+    @property
+    def version(self):
+        return self._get_snapshot().version
+
+    def search(self, query='', limit=None):
+        snapshot = self._get_snapshot()
+        keys, items = snapshot.keys, snapshot.items
+        query = query.casefold()
+        if not query:
+            return items[:limit]
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        result = items[start:end]
+        if limit is None or len(result) < limit:
+            result += [
+                item for key, item in zip(keys, items)
+                if query in key and not key.startswith(query)
+            ]
+        return result[:limit]
+
+    def _get_snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self._load()
+            self._store(snapshot)
+            return snapshot
+        if (
+            snapshot.generation != self._generation
+            or self._is_expired(snapshot)
+        ):
+            self.refresh()
+        return self._snapshot or snapshot
+
+    def _refresh_in_background(self):
+        try:
+            while True:
+                self._store(self._load())
+                with self._lock:
+                    snapshot = self._snapshot
+                    if (
+                        snapshot is not None
+                        and snapshot.generation == self._generation
+                    ):
+                        self._refreshing = False
+                        return
+        except Exception:
+            logger.exception('Не удалось обновить индекс ингредиентов')
+            with self._lock:
+                self._refreshing = False
+        finally:
+            connection.close()
+
+    def _is_expired(self, snapshot):
+        ttl = settings.INGREDIENT_INDEX_TTL
+        return ttl is not None and time.monotonic() - snapshot.loaded_at > ttl
+
+    def _store(self, snapshot):
+        """Сохраняет снимок, если за время загрузки не было сброса"""
+        with self._lock:
+            if snapshot.generation == self._generation:
+                self._snapshot = snapshot
+
+    def _load(self):
+        with self._lock:
+            generation = self._generation
+        loaded_at = time.monotonic()
+        rows = sorted(
+            Ingredient.objects.values(
+                'id', 'name', 'measurement_unit', 'updated_at'
+            ),
+            key=lambda row: (row['name'].casefold(), row['id']),
+        )
+        updated_at = [row.pop('updated_at') for row in rows]
+        version = len(rows), max(updated_at, default=None)
+        keys = [row['name'].casefold() for row in rows]
+        return Snapshot(loaded_at, generation, version, keys, rows)
+
+
+ingredient_index = IngredientIndex()
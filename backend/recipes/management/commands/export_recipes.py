@@ -0,0 +1,81 @@
+import json
+import sys
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from recipes.models import IngredientInRecipe, Recipe
+from recipes.utils import chunked
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Выгружает рецепты в NDJSON, по одному рецепту в строке'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default='-',
+            help='Файл для записи, по умолчанию stdout',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество рецептов, читаемых из базы за раз',
+        )
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            exported = self.export(sys.stdout, options['batch_size'])
+        else:
+            with open(options['path'], 'w', encoding='utf-8') as file:
+                exported = self.export(file, options['batch_size'])
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено рецептов: {exported}'
+        ))
+
+    def export(self, file, batch_size):
+        rows = Recipe.objects.order_by('id').values(
+            'id', 'author__username', 'name', 'image', 'text',
+            'cooking_time', 'pub_date',
+        ).iterator(chunk_size=batch_size)
+        exported = 0
+        for batch in chunked(rows, batch_size):
+            tags, ingredients = self.get_related([row['id'] for row in batch])
+            for row in batch:
+                recipe_id = row.pop('id')
+                row['author'] = row.pop('author__username')
+                row['tags'] = tags[recipe_id]
+                row['ingredients'] = ingredients[recipe_id]
+                file.write(json.dumps(
+                    row, ensure_ascii=False, cls=DjangoJSONEncoder
+                ))
+                file.write('\n')
+            exported += len(batch)
+            self.stderr.write(f'Выгружено: {exported}')
+        return exported
+
+    def get_related(self, recipe_ids):
+        tags = defaultdict(list)
+        for recipe_id, slug in Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'tag__slug').order_by('id'):
+            tags[recipe_id].append(slug)
+        ingredients = defaultdict(list)
+        for recipe_id, name, measurement_unit, amount in (
+            IngredientInRecipe.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values_list(
+                'recipe_id', 'ingredient__name',
+                'ingredient__measurement_unit', 'amount',
+            ).order_by('id')
+        ):
+            ingredients[recipe_id].append({
+                'name': name,
+                'measurement_unit': measurement_unit,
+                'amount': amount,
+            })
+        return tags, ingredients
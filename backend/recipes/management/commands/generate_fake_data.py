@@ -0,0 +1,321 @@
+import random
+import time
+from array import array
+from bisect import bisect
+from datetime import timedelta
+from io import BytesIO
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+from recipes.models import (FavoriteRecipe, Ingredient, IngredientInRecipe,
+                            Recipe, ShoppingCart, Tag)
+from recipes.utils import (bulk_create_with_pks, chunked,
+                           insert_ignore_conflicts)
+from users.models import Follow
+
+User = get_user_model()
+
+BATCH_SIZE = 5000
+IMAGE_DIR = 'recipes/images/fake'
+IMAGE_SIZE = (600, 400)
+DISHES = (
+    'Салат', 'Суп', 'Запеканка', 'Рагу', 'Паста', 'Пирог', 'Омлет', 'Каша',
+    'Соус', 'Десерт', 'Жаркое', 'Котлеты', 'Плов', 'Смузи', 'Блины',
+)
+# Диапазон и шаг количества по единице измерения.
+AMOUNTS = {
+    'г': (10, 1000, 10),
+    'кг': (1, 3, 1),
+    'мл': (50, 1000, 50),
+    'шт.': (1, 12, 1),
+    'ст. л.': (1, 6, 1),
+    'ч. л.': (1, 4, 1),
+    'стакан': (1, 4, 1),
+}
+DEFAULT_AMOUNT = (1, 5, 1)
+
+
+class PowerLaw:
+    """Выбор элементов с вероятностью, убывающей как 1 / rank ** exponent.
+
+    Ранги назначаются случайной перестановкой элементов, поэтому
+    популярные элементы не совпадают с первыми по id.
+    """
+
+    def __init__(self, items, exponent, rng):
+        self.items = array('q', items)
+        rng.shuffle(self.items)
+        self.cum_weights = array('d', accumulate(
+            1 / rank ** exponent for rank in range(1, len(self.items) + 1)
+        ))
+        self.total = self.cum_weights[-1] if self.items else 0
+
+    def choice(self, rng):
+        position = bisect(self.cum_weights, rng.random() * self.total)
+        return self.items[min(position, len(self.items) - 1)]
+
+    def sample(self, rng, count, exclude=None):
+        """До count различных элементов, кроме exclude"""
+        count = min(count, len(self.items) - (exclude is not None))
+        chosen = set()
+        for _ in range(count * 4):
+            if len(chosen) >= count:
+                break
+            item = self.choice(rng)
+            if item != exclude:
+                chosen.add(item)
+        return chosen
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует синтетических пользователей, рецепты, подписки, '
+        'избранное и корзины для проверки работы на больших объёмах'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument(
+            '--recipes', type=int, default=5000,
+            help='Всего рецептов; авторы распределены по степенному закону',
+        )
+        parser.add_argument(
+            '--follows', type=int, default=20000,
+            help='Примерное число подписок; популярность авторов '
+                 'распределена по степенному закону',
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=50000,
+            help='Примерное число записей в избранном',
+        )
+        parser.add_argument(
+            '--cart', type=int, default=5000,
+            help='Примерное число рецептов в корзинах',
+        )
+        parser.add_argument(
+            '--tags', type=int, default=0,
+            help='Довести число тегов до указанного',
+        )
+        parser.add_argument(
+            '--images', type=int, default=1,
+            help='Число различных изображений-заглушек, 0 — без изображений',
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель степенного распределения популярности',
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней распределить даты публикации',
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--prefix', default='fake',
+            help='Префикс имён пользователей',
+        )
+        parser.add_argument(
+            '--password',
+            help='Пароль пользователей, по умолчанию вход запрещён',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Количество строк в одной транзакции',
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.skew = options['skew']
+        self.batch_size = options['batch_size']
+        self.prefix = f'{options["prefix"]}{options["seed"]}_'
+        if User.objects.filter(username__startswith=self.prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {self.prefix} уже созданы, '
+                'укажите другой --seed или --prefix'
+            )
+        if not Ingredient.objects.exists():
+            call_command('load_ingredients', stdout=self.stdout)
+        started = time.perf_counter()
+
+        self.ensure_tags(options['tags'])
+        user_ids = self.step('Пользователи', self.create_users, (
+            options['users'], options['password'],
+        ))
+        images = self.create_images(options['images'])
+        recipe_ids = self.step('Рецепты', self.create_recipes, (
+            options['recipes'], user_ids, images, options['days'],
+        ))
+        authors = PowerLaw(user_ids, self.skew, self.rng)
+        popular = PowerLaw(recipe_ids, self.skew, self.rng)
+        self.step('Подписки', self.create_relations, (
+            Follow, 'author_id', user_ids, authors,
+            options['follows'], True,
+        ))
+        self.step('Избранное', self.create_relations, (
+            FavoriteRecipe, 'recipe_id', user_ids, popular,
+            options['favorites'], False,
+        ))
+        self.step('Корзины', self.create_relations, (
+            ShoppingCart, 'recipe_id', user_ids,
+            PowerLaw(recipe_ids, 0, self.rng), options['cart'], False,
+        ))
+        call_command('rebuild_shopping_lists', stdout=self.stdout)
+        call_command('reconcile_counters', stdout=self.stdout)
+        call_command('rebuild_feed', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - started:.1f} с'
+        ))
+
+    def step(self, title, create, args):
+        started = time.perf_counter()
+        result = create(*args)
+        count = result if isinstance(result, int) else len(result)
+        self.stdout.write(
+            f'{title}: {count} за {time.perf_counter() - started:.1f} с'
+        )
+        return result
+
+    def ensure_tags(self, count):
+        missing = count - Tag.objects.count()
+        if missing <= 0:
+            return
+        Tag.objects.bulk_create([
+            Tag(
+                name=f'Тег {self.prefix}{number}',
+                color=f'#{self.rng.randrange(0x1000000):06x}',
+                slug=f'{self.prefix}{number}'.replace('_', '-'),
+            )
+            for number in range(missing)
+        ])
+
+    def create_users(self, count, password):
+        password = make_password(password)
+        user_ids = array('q')
+        for numbers in chunked(range(count), self.batch_size):
+            with transaction.atomic():
+                users = bulk_create_with_pks(User, [
+                    User(
+                        username=f'{self.prefix}{number}',
+                        email=f'{self.prefix}{number}@example.com',
+                        first_name=f'Имя{number}',
+                        last_name=f'Фамилия{number}',
+                        password=password,
+                    )
+                    for number in numbers
+                ])
+            user_ids.extend(user.id for user in users)
+        return user_ids
+
+    def create_images(self, count):
+        names = []
+        for number in range(count):
+            buffer = BytesIO()
+            Image.new(
+                'RGB', IMAGE_SIZE, tuple(self.rng.choices(range(256), k=3))
+            ).save(buffer, 'JPEG')
+            names.append(default_storage.save(
+                f'{IMAGE_DIR}/{self.prefix}{number}.jpg',
+                ContentFile(buffer.getvalue()),
+            ))
+        return names or ['']
+
+    def build_recipe(self, author_id, images, now, days, ingredients, tags):
+        rng = self.rng
+        amounts = {}
+        for ingredient_id in ingredients.sample(
+            rng, round(rng.triangular(3, 15, 7))
+        ):
+            low, high, step = AMOUNTS.get(
+                self.units[ingredient_id], DEFAULT_AMOUNT
+            )
+            amounts[ingredient_id] = rng.randrange(low, high + 1, step)
+        names = [self.names[pk] for pk in amounts]
+        recipe = Recipe(
+            author_id=author_id,
+            name=f'{rng.choice(DISHES)}: {names[0]}',
+            text=f'Понадобится: {", ".join(names)}. Смешать и подать.',
+            cooking_time=rng.randint(5, 180),
+            image=rng.choice(images),
+        )
+        pub_date = now - timedelta(seconds=rng.randrange(days * 86400 + 1))
+        return recipe, pub_date, tags.sample(rng, rng.randint(1, 3)), amounts
+
+    def create_recipes(self, count, user_ids, images, days):
+        ingredients = list(Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit'
+        ))
+        self.names = {pk: name for pk, name, _ in ingredients}
+        self.units = {pk: unit for pk, _, unit in ingredients}
+        catalog = PowerLaw(self.names, self.skew, self.rng)
+        tags = PowerLaw(
+            Tag.objects.values_list('id', flat=True), self.skew, self.rng
+        )
+        authors = PowerLaw(user_ids, self.skew, self.rng)
+        now = timezone.now()
+        recipe_ids = array('q')
+        for numbers in chunked(range(count), self.batch_size):
+            built = [
+                self.build_recipe(
+                    authors.choice(self.rng), images, now, days,
+                    catalog, tags,
+                )
+                for _ in numbers
+            ]
+            with transaction.atomic():
+                recipe_ids.extend(self.save_recipes(built))
+        return recipe_ids
+
+    def save_recipes(self, built):
+        recipes = bulk_create_with_pks(
+            Recipe, [recipe for recipe, *_ in built]
+        )
+        for recipe, pub_date, _, _ in built:
+            recipe.pub_date = pub_date
+        Recipe.objects.bulk_update(recipes, ('pub_date',))
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+            for recipe, _, tag_ids, _ in built
+            for tag_id in tag_ids
+        ])
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(
+                recipe_id=recipe.id,
+                ingredient_id=ingredient_id,
+                amount=amount,
+            )
+            for recipe, _, _, amounts in built
+            for ingredient_id, amount in amounts.items()
+        ])
+        return [recipe.id for recipe in recipes]
+
+    def create_relations(self, model, field, user_ids, targets, total,
+                         exclude_self):
+        """Связи пользователь — объект без повторов у одного пользователя.
+
+        Число связей пользователя распределено экспоненциально со средним
+        total / users, объекты выбираются по популярности targets.
+        """
+        if not user_ids or not total:
+            return 0
+        mean = total / len(user_ids)
+        rows = (
+            model(user_id=user_id, **{field: target})
+            for user_id in user_ids
+            for target in targets.sample(
+                self.rng,
+                round(self.rng.expovariate(1 / mean)),
+                exclude=user_id if exclude_self else None,
+            )
+        )
+        created = 0
+        for batch in chunked(rows, self.batch_size):
+            with transaction.atomic():
+                created += insert_ignore_conflicts(model, batch)
+        return created
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.images import (existing_variants, generate_variants,
+                            record_variants)
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные и WebP-варианты изображений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing',
+            action='store_true',
+            help=(
+                'Создавать варианты только для изображений без них, '
+                'готовые лишь отметить в рецептах'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        names = Recipe.objects.exclude(image='').values_list(
+            'image', flat=True
+        ).order_by().distinct().iterator()
+        processed = failed = 0
+        for name in names:
+            if options['missing']:
+                variants = existing_variants(name)
+                if len(variants) == len(settings.RECIPE_IMAGE_VARIANTS):
+                    record_variants(name, list(variants))
+                    continue
+            try:
+                record_variants(name, generate_variants(name))
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+                continue
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {processed}, с ошибками: {failed}'
+        ))
@@ -0,0 +1,205 @@
+import json
+import sys
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from recipes.models import (FeedEntry, Ingredient, IngredientInRecipe, Recipe,
+                            Tag)
+from recipes.utils import bulk_create_with_pks, chunked
+from users.models import AuthorStats
+
+User = get_user_model()
+
+BATCH_SIZE = 500
+
+
+class Lookups:
+    """Кэш соответствий естественных ключей и id, дополняемый пачками"""
+
+    def __init__(self):
+        self.authors = {}
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients = {}
+
+    def load(self, records):
+        usernames = {
+            record.get('author') for record in records
+        } - self.authors.keys()
+        if usernames:
+            self.authors.update(User.objects.filter(
+                username__in=usernames
+            ).values_list('username', 'id'))
+        keys = {
+            (item.get('name'), item.get('measurement_unit'))
+            for record in records
+            for item in record.get('ingredients', ())
+        } - self.ingredients.keys()
+        if keys:
+            for ingredient_id, name, measurement_unit in (
+                Ingredient.objects.filter(
+                    name__in={name for name, _ in keys}
+                ).values_list('id', 'name', 'measurement_unit')
+            ):
+                self.ingredients[name, measurement_unit] = ingredient_id
+
+
+def validate(instance, exclude):
+    """Проверяет поля валидаторами модели, без запросов к базе"""
+    try:
+        instance.clean_fields(exclude=exclude)
+    except ValidationError as error:
+        raise ValueError('; '.join(
+            f'{field}: {" ".join(messages)}'
+            for field, messages in error.message_dict.items()
+        ))
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает рецепты из NDJSON, созданного export_recipes, '
+        'и раздаёт их в ленты подписчиков авторов. '
+        'Файлы изображений переносятся отдельно'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default='-',
+            help='Файл NDJSON, по умолчанию stdin',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество рецептов в одной транзакции',
+        )
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            self.import_file(sys.stdin, options['batch_size'])
+            return
+        try:
+            with open(options['path'], encoding='utf-8') as file:
+                self.import_file(file, options['batch_size'])
+        except OSError as error:
+            raise CommandError(error)
+
+    def import_file(self, file, batch_size):
+        self.lookups = Lookups()
+        imported = skipped = 0
+        lines = (
+            (number, line)
+            for number, line in enumerate(file, start=1)
+            if line.strip()
+        )
+        for batch in chunked(lines, batch_size):
+            records = []
+            for number, line in batch:
+                try:
+                    record = json.loads(line)
+                    if not isinstance(record, dict):
+                        raise ValueError('ожидается объект JSON')
+                except ValueError as error:
+                    skipped += 1
+                    self.stderr.write(f'Строка {number}: {error}')
+                    continue
+                records.append((number, record))
+            self.lookups.load([record for _, record in records])
+            created = self.import_batch(records)
+            imported += created
+            skipped += len(records) - created
+            self.stderr.write(f'Загружено: {imported}, пропущено: {skipped}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено рецептов: {imported}, пропущено: {skipped}'
+        ))
+
+    def build(self, record):
+        lookups = self.lookups
+        author_id = lookups.authors.get(record['author'])
+        if author_id is None:
+            raise ValueError(f'автор {record["author"]} не найден')
+        missing_tags = set(record['tags']) - lookups.tags.keys()
+        if missing_tags:
+            raise ValueError(f'теги не найдены: {sorted(missing_tags)}')
+        amounts = {}
+        for item in record['ingredients']:
+            key = item['name'], item['measurement_unit']
+            if key not in lookups.ingredients:
+                raise ValueError(f'ингредиент {key} не найден')
+            if lookups.ingredients[key] in amounts:
+                raise ValueError(f'ингредиент {key} указан повторно')
+            amount = int(item['amount'])
+            validate(
+                IngredientInRecipe(amount=amount),
+                ('recipe', 'ingredient'),
+            )
+            amounts[lookups.ingredients[key]] = amount
+        if not amounts:
+            raise ValueError('не указаны ингредиенты')
+        recipe = Recipe(
+            author_id=author_id,
+            name=str(record['name']).strip(),
+            image=record.get('image', ''),
+            text=str(record['text']).strip(),
+            cooking_time=int(record['cooking_time']),
+        )
+        validate(recipe, ('author', 'image'))
+        tag_ids = {lookups.tags[slug] for slug in record['tags']}
+        pub_date = record.get('pub_date') and parse_datetime(
+            record['pub_date']
+        )
+        return recipe, pub_date, tag_ids, amounts
+
+    @transaction.atomic
+    def import_batch(self, records):
+        built = []
+        for number, record in records:
+            try:
+                built.append(self.build(record))
+            except (KeyError, TypeError, ValueError) as error:
+                self.stderr.write(f'Строка {number}: {error!r}')
+        if not built:
+            return 0
+        recipes = [recipe for recipe, *_ in built]
+        bulk_create_with_pks(Recipe, recipes)
+        dated = []
+        for recipe, pub_date, _, _ in built:
+            if pub_date:
+                recipe.pub_date = pub_date
+                dated.append(recipe)
+        Recipe.objects.bulk_update(dated, ('pub_date',))
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+            for recipe, _, tag_ids, _ in built
+            for tag_id in tag_ids
+        ])
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(
+                recipe_id=recipe.id,
+                ingredient_id=ingredient_id,
+                amount=amount,
+            )
+            for recipe, _, _, amounts in built
+            for ingredient_id, amount in amounts.items()
+        ])
+        self.count_recipes(recipes)
+        FeedEntry.objects.fan_out([recipe.id for recipe in recipes])
+        return len(built)
+
+    def count_recipes(self, recipes):
+        """Увеличивает счётчики рецептов авторов пачки"""
+        created = defaultdict(int)
+        for recipe in recipes:
+            created[recipe.author_id] += 1
+        authors = defaultdict(list)
+        for author_id, count in created.items():
+            authors[count].append(author_id)
+        for count, author_ids in authors.items():
+            AuthorStats.objects.change_counter(
+                'recipes_count', author_ids, count
+            )
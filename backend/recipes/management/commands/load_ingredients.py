@@ -0,0 +1,114 @@
+import csv
+import json
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Ingredient
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+JSON_SEPARATORS = frozenset(' \t\r\n[],')
+DEFAULT_PATHS = (
+    settings.BASE_DIR.parent / 'data' / 'ingredients.csv',
+    settings.BASE_DIR / 'ingredients.json',
+)
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def read_json(file):
+    """Читает массив JSON-объектов по частям, не загружая файл целиком"""
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+    while True:
+        while position < len(buffer) and buffer[position] in JSON_SEPARATORS:
+            position += 1
+        if position < len(buffer):
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if eof:
+                    raise
+            else:
+                yield item['name'], item['measurement_unit']
+                continue
+        elif eof:
+            return
+        chunk = file.read(CHUNK_SIZE)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+READERS = {'.csv': read_csv, '.json': read_json}
+
+
+class Command(BaseCommand):
+    help = 'Загружает справочник ингредиентов из CSV или JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            help='Путь к файлу .csv или .json (по умолчанию data/)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество записей в одном INSERT',
+        )
+
+    def get_path(self, path):
+        if path:
+            return Path(path)
+        for default in DEFAULT_PATHS:
+            if default.exists():
+                return default
+        raise CommandError('Файл с ингредиентами не найден')
+
+    def handle(self, *args, **options):
+        path = self.get_path(options['path'])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError(f'Неподдерживаемый формат файла: {path}')
+        started = time.monotonic()
+        try:
+            with open(path, encoding='utf-8', newline='') as file:
+                read, created = self.load(
+                    reader(file), options['batch_size']
+                )
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error!r}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано записей: {read}, добавлено ингредиентов: {created} '
+            f'за {time.monotonic() - started:.2f} с'
+        ))
+
+    @transaction.atomic
+    def load(self, rows, batch_size):
+        before = Ingredient.objects.count()
+        seen = set()
+        batch = []
+        read = 0
+        for name, measurement_unit in rows:
+            read += 1
+            key = (name.strip(), measurement_unit.strip())
+            if not all(key) or key in seen:
+                continue
+            seen.add(key)
+            batch.append(Ingredient(name=key[0], measurement_unit=key[1]))
+            if len(batch) >= batch_size:
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+        transaction.on_commit(ingredient_index.invalidate)
+        return read, Ingredient.objects.count() - before
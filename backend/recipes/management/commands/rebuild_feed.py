@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import FeedEntry
+from recipes.utils import chunked
+from users.models import AuthorStats, Follow
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает ленты подписок: последние рецепты авторов, '
+        'которые раздаются подписчикам при записи. Без --user заново '
+        'определяет авторов, чьи рецепты читаются при запросе ленты'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='users',
+            help='Ограничить пользователем (можно указать несколько раз)',
+        )
+
+    def handle(self, *args, **options):
+        users = options['users']
+        if users:
+            FeedEntry.objects.filter(user_id__in=users).delete()
+        else:
+            AuthorStats.objects.reset_pulled()
+            FeedEntry.objects.all().delete()
+            users = list(Follow.objects.values_list(
+                'user_id', flat=True
+            ).distinct().order_by('user_id'))
+        created = 0
+        for user_ids in chunked(users, BATCH_SIZE):
+            with transaction.atomic():
+                created += FeedEntry.objects.backfill(user_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты подписок пересобраны, записей: {created}'
+        ))
@@ -0,0 +1,98 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+from recipes.models import IngredientInRecipe, ShoppingListItem
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает или проверяет материализованные списки покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить с корзинами, ничего не изменяя',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='users',
+            help='Ограничить пользователем (можно указать несколько раз)',
+        )
+
+    def handle(self, *args, **options):
+        users = options['users']
+        if options['verify']:
+            self.verify(users)
+        else:
+            self.rebuild(users)
+
+    def get_expected(self, users):
+        if users:
+            queryset = IngredientInRecipe.objects.filter(
+                recipe__cart__user__in=users
+            )
+        else:
+            queryset = IngredientInRecipe.objects.filter(
+                recipe__cart__isnull=False
+            )
+        return queryset.values_list(
+            'recipe__cart__user', 'ingredient'
+        ).annotate(total=Sum('amount')).order_by()
+
+    def get_items(self, users):
+        if users:
+            return ShoppingListItem.objects.filter(user__in=users)
+        return ShoppingListItem.objects.all()
+
+    @transaction.atomic
+    def rebuild(self, users):
+        self.get_items(users).delete()
+        batch, created = [], 0
+        for user_id, ingredient_id, total in self.get_expected(
+            users
+        ).iterator():
+            batch.append(ShoppingListItem(
+                user_id=user_id, ingredient_id=ingredient_id, total=total
+            ))
+            if len(batch) >= BATCH_SIZE:
+                ShoppingListItem.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        ShoppingListItem.objects.bulk_create(batch)
+        created += len(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересобраны, позиций: {created}'
+        ))
+
+    def verify(self, users):
+        expected = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total in self.get_expected(
+                users
+            ).iterator()
+        }
+        actual = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total in self.get_items(
+                users
+            ).values_list('user', 'ingredient', 'total').iterator()
+        }
+        mismatched = {
+            key for key in expected.keys() | actual.keys()
+            if expected.get(key) != actual.get(key)
+        }
+        for user_id, ingredient_id in sorted(mismatched):
+            key = (user_id, ingredient_id)
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'ожидалось {expected.get(key)}, сохранено {actual.get(key)}'
+            )
+        if mismatched:
+            raise CommandError(
+                f'Расхождений в списках покупок: {len(mismatched)}'
+            )
+        self.stdout.write(self.style.SUCCESS('Списки покупок согласованы'))
@@ -0,0 +1,114 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import OuterRef
+from recipes.models import RECIPE_COUNTERS, Recipe
+from recipes.utils import chunked
+from users.models import AuthorStats, Follow, count_subquery
+
+BATCH_SIZE = 1000
+SHOWN_MISMATCHES = 20
+AUTHOR_COUNTERS = ('recipes_count', 'followers_count')
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает или проверяет счётчики избранного и корзин рецептов, '
+        'рецептов и подписчиков авторов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить с исходными таблицами, ничего не изменяя',
+        )
+
+    def handle(self, *args, **options):
+        recipes = self.get_recipe_mismatches()
+        authors = self.get_author_mismatches()
+        if options['verify']:
+            self.report('Рецепт', recipes)
+            self.report('Автор', authors)
+            if recipes or authors:
+                raise CommandError(
+                    f'Расхождений в счётчиках: рецептов {len(recipes)}, '
+                    f'авторов {len(authors)}'
+                )
+            self.stdout.write(self.style.SUCCESS('Счётчики согласованы'))
+            return
+        for ids in chunked(recipes, BATCH_SIZE):
+            self.fix_recipes(ids)
+        for ids in chunked(authors, BATCH_SIZE):
+            self.fix_authors(ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пересчитаны: рецептов {len(recipes)}, '
+            f'авторов {len(authors)}'
+        ))
+
+    def get_recipe_mismatches(self):
+        fields = list(RECIPE_COUNTERS.values())
+        rows = Recipe.objects.actual_counters().values_list(
+            'id', *fields, *(f'actual_{field}' for field in fields)
+        ).order_by()
+        return {
+            pk: dict(zip(fields, zip(values, values[len(fields):])))
+            for pk, *values in rows.iterator()
+            if values[:len(fields)] != values[len(fields):]
+        }
+
+    def get_author_mismatches(self):
+        rows = AuthorStats.objects.actual().values_list(
+            'id',
+            'stats__recipes_count',
+            'stats__followers_count',
+            'actual_recipes_count',
+            'actual_followers_count',
+        ).order_by()
+        mismatches = {}
+        for pk, *stored, recipes_count, followers_count in rows.iterator():
+            actual = [recipes_count, followers_count]
+            if stored[0] is None and not any(actual):
+                continue
+            if stored != actual:
+                mismatches[pk] = dict(
+                    zip(AUTHOR_COUNTERS, zip(stored, actual))
+                )
+        return mismatches
+
+    def report(self, title, mismatches):
+        for pk in sorted(mismatches)[:SHOWN_MISMATCHES]:
+            values = ', '.join(
+                f'{field}: сохранено {stored}, ожидалось {actual}'
+                for field, (stored, actual) in mismatches[pk].items()
+                if stored != actual
+            )
+            self.stdout.write(f'{title} {pk}: {values}')
+        if len(mismatches) > SHOWN_MISMATCHES:
+            self.stdout.write(
+                f'... ещё {len(mismatches) - SHOWN_MISMATCHES}'
+            )
+
+    @transaction.atomic
+    def fix_recipes(self, ids):
+        """Пересчёт в самом UPDATE не теряет параллельных изменений"""
+        Recipe.objects.filter(pk__in=ids).update(**{
+            field: count_subquery(
+                model.objects.filter(recipe=OuterRef('pk')), 'recipe'
+            )
+            for model, field in RECIPE_COUNTERS.items()
+        })
+
+    @transaction.atomic
+    def fix_authors(self, ids):
+        AuthorStats.objects.bulk_create(
+            [AuthorStats(user_id=pk) for pk in ids], ignore_conflicts=True
+        )
+        AuthorStats.objects.filter(user_id__in=ids).update(
+            recipes_count=count_subquery(
+                Recipe.objects.filter(author=OuterRef('user')), 'author'
+            ),
+            followers_count=count_subquery(
+                Follow.objects.filter(author=OuterRef('user')), 'author'
+            ),
+        )
+        AuthorStats.objects.filter(user_id__in=ids).mark_pulled()
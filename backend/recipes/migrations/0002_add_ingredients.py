@@ -1,40 +1,34 @@
 import json
+from pathlib import Path
 
 from django.db import migrations
 
-INGREDIENTS = []
+INGREDIENTS_FILE = Path(__file__).resolve().parents[2] / 'ingredients.json'
 
 
-def make_migration(apps, schema_editor):
-    global INGREDIENTS
-    file = open('ingredients.json', encoding='UTF-8')
-    data = json.load(file)
-    for ingredient in data:
-        data_dict = {
-            'name': ingredient['name'],
-            'measurement_unit': ingredient['measurement_unit']
-        }
-        if data_dict not in INGREDIENTS:
-            INGREDIENTS.append(data_dict)
-    return INGREDIENTS
+def read_ingredients():
+    with open(INGREDIENTS_FILE, encoding='UTF-8') as file:
+        data = json.load(file)
+    return list(dict.fromkeys(
+        (ingredient['name'], ingredient['measurement_unit'])
+        for ingredient in data
+    ))
 
 
 def add_ingredient(apps, schema_editor):
     Ingredient = apps.get_model("recipes", "Ingredient")
     ingredients = [
-        Ingredient(
-            name=ingredient['name'],
-            measurement_unit=ingredient['measurement_unit']
-        )
-        for ingredient in INGREDIENTS
+        Ingredient(name=name, measurement_unit=measurement_unit)
+        for name, measurement_unit in read_ingredients()
     ]
-    Ingredient.objects.bulk_create(ingredients)
+    Ingredient.objects.bulk_create(ingredients, batch_size=1000)
 
 
 def remove_ingredient(apps, schema_editor):
     Ingredient = apps.get_model("recipes", "Ingredient")
-    for ingredient in INGREDIENTS:
-        Ingredient.objects.get(id=ingredient['id']).delete()
+    Ingredient.objects.filter(
+        name__in={name for name, _ in read_ingredients()}
+    ).delete()
 
 
 class Migration(migrations.Migration):
@@ -44,9 +38,6 @@ class Migration(migrations.Migration):
     ]
 
     operations = [
-        migrations.RunPython(
-            make_migration,
-        ),
         migrations.RunPython(
             add_ingredient,
             remove_ingredient,
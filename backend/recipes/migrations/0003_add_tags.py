@@ -20,8 +20,7 @@ def add_tag(apps, schema_editor):
 
 def remove_tag(apps, schema_editor):
     Tag = apps.get_model("recipes", "Tag")
-    for tag in TAGS:
-        Tag.objects.get(id=tag['id']).delete()
+    Tag.objects.filter(slug__in=[tag['slug'] for tag in TAGS]).delete()
 
 
 class Migration(migrations.Migration):
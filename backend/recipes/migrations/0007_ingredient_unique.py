@@ -0,0 +1,78 @@
+# Generated by Django 3.2 on 2026-10-17 06:37
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_rows(rows, key, value, keep_id):
+    """Оставляет по строке на key с суммой value и ингредиентом keep_id.
+
+    Первой для каждого key идёт строка с меньшим id ингредиента.
+    """
+    kept = {}
+    deleted = []
+    for row in rows:
+        current = kept.get(getattr(row, key))
+        if current is None:
+            row.ingredient_id = keep_id
+            kept[getattr(row, key)] = row
+        else:
+            setattr(current, value, getattr(current, value) + getattr(
+                row, value
+            ))
+            deleted.append(row.id)
+    return list(kept.values()), deleted
+
+
+def merge_duplicates(apps, schema_editor):
+    """Сводит повторы (name, measurement_unit) к ингредиенту с меньшим id.
+
+    Строки рецептов и списков покупок переносятся на оставшийся
+    ингредиент; если у рецепта или пользователя уже есть строка с ним,
+    количества складываются.
+    """
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    groups = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep_id=Min('id'), count=Count('id')).filter(
+        count__gt=1
+    ).order_by()
+    for group in groups:
+        ids = list(Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).values_list('id', flat=True))
+        for model, key, value in (
+            (IngredientInRecipe, 'recipe_id', 'amount'),
+            (ShoppingListItem, 'user_id', 'total'),
+        ):
+            rows = model.objects.filter(ingredient_id__in=ids).order_by(
+                'ingredient_id', 'id'
+            )
+            kept, deleted = merge_rows(rows, key, value, group['keep_id'])
+            model.objects.filter(id__in=deleted).delete()
+            model.objects.bulk_update(kept, ('ingredient', value))
+        Ingredient.objects.filter(id__in=ids).exclude(
+            id=group['keep_id']
+        ).delete()
+    if schema_editor.connection.vendor == 'postgresql':
+        # Отложенные проверки внешних ключей не дают изменить таблицу
+        # в той же транзакции.
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        schema_editor.execute('SET CONSTRAINTS ALL DEFERRED')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_name_unit'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-17 07:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_feedentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.JSONField(default=list, editable=False, verbose_name='Готовые варианты изображения'),
+        ),
+    ]
@@ -1,10 +1,25 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connection, models
+from django.db.models import (BooleanField, Case, Count, Exists, F, Max,
+                              OuterRef, Prefetch, Q, Subquery, Sum, Value,
+                              When)
+from django.db.models.functions import Coalesce, Greatest
+from users.models import AuthorStats, Follow, count_subquery
 
 User = get_user_model()
 
 
+def get_version(queryset):
+    """Версия набора записей: количество и время последнего изменения"""
+    version = queryset.aggregate(
+        count=Count('pk'), updated_at=Max('updated_at')
+    )
+    return version['count'], version['updated_at']
+
+
 class Tag(models.Model):
     name = models.CharField(
         verbose_name='Наименование тега',
@@ -21,6 +36,10 @@ class Tag(models.Model):
         max_length=50,
         unique=True,
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
 
     class Meta:
         verbose_name = 'Тег'
@@ -40,16 +59,109 @@ class Ingredient(models.Model):
         verbose_name='Единица измерения',
         max_length=50
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
 
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ('name', 'id')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_name_unit'
+            )
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}.'
 
 
+class RecipeQuerySet(models.QuerySet):
+    def with_user_flags(self, user):
+        if user.is_anonymous:
+            false = Value(False, output_field=BooleanField())
+            return self.annotate(
+                is_favorited=false,
+                is_in_shopping_cart=false,
+                is_subscribed=false,
+            )
+        return self.annotate(
+            is_favorited=Exists(FavoriteRecipe.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_subscribed=Exists(Follow.objects.filter(
+                user=user, author=OuterRef('author')
+            )),
+        )
+
+    def for_read(self, user):
+        return self.with_user_flags(user).defer(
+            'search_vector'
+        ).select_related(
+            'author'
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredients_amount',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
+
+    def change_counter(self, field, recipe_ids, delta):
+        """Атомарно изменяет счётчик field рецептов recipe_ids на delta"""
+        if not delta:
+            return 0
+        return self.filter(pk__in=recipe_ids).update(
+            **{field: Greatest(F(field) + delta, 0)}
+        )
+
+    def subtract_rows(self, model, rows):
+        """Вычитает из счётчика связи model число ещё не удалённых rows"""
+        field = RECIPE_COUNTERS[model]
+        return self.filter(pk__in=rows.values('recipe')).update(**{
+            field: Greatest(F(field) - count_subquery(
+                rows.filter(recipe=OuterRef('pk')), 'recipe'
+            ), 0),
+        })
+
+    def actual_counters(self):
+        """Рецепты с пересчитанными по исходным таблицам счётчиками"""
+        return self.annotate(**{
+            f'actual_{field}': count_subquery(
+                model.objects.filter(recipe=OuterRef('pk')), 'recipe'
+            )
+            for model, field in RECIPE_COUNTERS.items()
+        })
+
+    def latest_for_authors(self, author_ids, limit=None):
+        """Последние рецепты авторов одним запросом, до limit на автора."""
+        if not limit:
+            return self.filter(author_id__in=author_ids).only(
+                'id', 'author_id', 'name', 'image', 'cooking_time'
+            )
+        placeholders = ', '.join(['%s'] * len(author_ids))
+        return self.raw(
+            'SELECT id, author_id, name, image, cooking_time FROM ('
+            'SELECT id, author_id, name, image, cooking_time, pub_date, '
+            'ROW_NUMBER() OVER ('
+            'PARTITION BY author_id ORDER BY pub_date DESC, id DESC'
+            ') AS author_position '
+            f'FROM {self.model._meta.db_table} '
+            f'WHERE author_id IN ({placeholders})'
+            ') AS ranked WHERE author_position <= %s '
+            'ORDER BY pub_date DESC, id DESC',
+            [*author_ids, limit],
+        )
+
+
 class Recipe(models.Model):
     tags = models.ManyToManyField(
         Tag,
@@ -88,11 +200,46 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В корзинах',
+        default=0,
+        editable=False,
+    )
+    image_variants = models.JSONField(
+        verbose_name='Готовые варианты изображения',
+        default=list,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name}'
@@ -191,3 +338,329 @@ class ShoppingCart(models.Model):
     def __str__(self):
         return (f'Пользователь: {self.user},'
                 f'рецепт в списке: {self.recipe.name}')
+
+
+# Счётчик рецепта, который поддерживается для каждой связи с пользователем.
+RECIPE_COUNTERS = {
+    FavoriteRecipe: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+
+class ShoppingListQuerySet(models.QuerySet):
+    def apply_amounts(self, user_ids, amounts):
+        """Изменяет итоги пользователей на {ingredient_id: разница}"""
+        amounts = {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items() if amount
+        }
+        if not amounts:
+            return
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        self.bulk_create(
+            [
+                self.model(user_id=user_id, ingredient_id=ingredient_id)
+                for user_id in user_ids
+                for ingredient_id, amount in amounts.items() if amount > 0
+            ],
+            ignore_conflicts=True,
+        )
+        items = self.filter(user_id__in=user_ids, ingredient_id__in=amounts)
+        items.update(total=Greatest(
+            F('total') + Case(
+                *[
+                    When(ingredient_id=ingredient_id, then=Value(amount))
+                    for ingredient_id, amount in amounts.items()
+                ],
+                default=Value(0),
+            ),
+            Value(0),
+        ))
+        items.filter(total=0).delete()
+
+    def add_recipe(self, user_ids, recipe_id):
+        self.apply_amounts(user_ids, recipe_amounts(recipe_id))
+
+    def remove_recipe(self, user_ids, recipe_id):
+        self.apply_amounts(user_ids, {
+            ingredient_id: -amount
+            for ingredient_id, amount in recipe_amounts(recipe_id).items()
+        })
+
+    def add_recipes(self, user_ids, recipe_ids):
+        self.apply_amounts(user_ids, recipes_amounts(recipe_ids))
+
+    def remove_recipes(self, user_ids, recipe_ids):
+        self.apply_amounts(user_ids, {
+            ingredient_id: -amount
+            for ingredient_id, amount in recipes_amounts(recipe_ids).items()
+        })
+
+    def remove_carts(self, carts):
+        """Вычитает из итогов рецепты строк корзин carts.
+
+        Каждому пользователю вычитаются только его строки; вызывается
+        до удаления строк корзин и ингредиентов рецептов.
+        """
+        removed = IngredientInRecipe.objects.filter(
+            ingredient=OuterRef('ingredient'),
+            recipe__in=carts.filter(
+                user=OuterRef(OuterRef('user'))
+            ).values('recipe'),
+        ).values('ingredient').annotate(total=Sum('amount')).values('total')
+        items = self.filter(
+            user__in=carts.values('user'),
+            ingredient__in=IngredientInRecipe.objects.filter(
+                recipe__in=carts.values('recipe')
+            ).values('ingredient'),
+        )
+        items.update(total=Greatest(
+            F('total') - Coalesce(Subquery(removed), Value(0)), Value(0)
+        ))
+        items.filter(total=0).delete()
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Ингредиент',
+    )
+    total = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество',
+    )
+
+    objects = ShoppingListQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        ordering = ('user', 'ingredient__name')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.total}'
+
+
+def recipe_amounts(recipe_id):
+    return dict(IngredientInRecipe.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('ingredient_id', 'amount'))
+
+
+def recipes_amounts(recipe_ids):
+    return dict(IngredientInRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('ingredient_id').annotate(
+        total=Sum('amount')
+    ).order_by())
+
+
+def before_recipes_delete(recipes):
+    """Вычитает рецепты recipes из списков покупок и счётчиков авторов"""
+    ShoppingListItem.objects.remove_carts(
+        ShoppingCart.objects.filter(recipe__in=recipes)
+    )
+    AuthorStats.objects.subtract_rows(
+        'recipes_count', Recipe.objects.filter(pk__in=recipes), 'author'
+    )
+
+
+def before_users_delete(users):
+    """Готовит удаление пользователей users вместе с их рецептами.
+
+    Каскадное удаление обходит пути API, которые поддерживают итоги
+    списков покупок и счётчики, поэтому они меняются здесь, пока
+    строки есть.
+    """
+    before_recipes_delete(Recipe.objects.filter(author__in=users))
+    for model in RECIPE_COUNTERS:
+        Recipe.objects.subtract_rows(
+            model, model.objects.filter(user__in=users)
+        )
+    AuthorStats.objects.subtract_rows(
+        'followers_count', Follow.objects.filter(user__in=users), 'author'
+    )
+
+
+def before_key(pub_date_field, id_field, before):
+    """Условие keyset-пагинации: записи строго после ключа (pub_date, id)"""
+    pub_date, pk = before
+    return Q(**{f'{pub_date_field}__lt': pub_date}) | Q(**{
+        pub_date_field: pub_date, f'{id_field}__lt': pk,
+    })
+
+
+class FeedEntryQuerySet(models.QuerySet):
+    """Лента подписок: рецепты раздаются подписчикам при записи.
+
+    Рецепты авторов, у которых хоть раз стало больше
+    FEED_FANOUT_MAX_FOLLOWERS подписчиков (AuthorStats.feed_pulled),
+    не раздаются, а дочитываются из Recipe при чтении ленты. Отметка
+    снимается только пересборкой лент, поэтому подписчики, пришедшие
+    в это время, не теряют рецепты автора, когда подписчиков становится
+    меньше порога.
+    """
+
+    def insert_select(self, select, params):
+        """Вставляет строки (user, recipe, author, pub_date) из select"""
+        quote_name = connection.ops.quote_name
+        meta = self.model._meta
+        columns = ', '.join(
+            quote_name(meta.get_field(name).column)
+            for name in ('user', 'recipe', 'author', 'pub_date')
+        )
+        ops = connection.ops
+        sql = (
+            f'{ops.insert_statement(ignore_conflicts=True)} '
+            f'{quote_name(meta.db_table)} ({columns}) {select} '
+            f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
+
+    def not_celebrity(self, author_column):
+        return (
+            f'NOT EXISTS (SELECT 1 FROM {AuthorStats._meta.db_table} '
+            f'WHERE user_id = {author_column} AND feed_pulled)'
+        )
+
+    def fan_out(self, recipe_ids):
+        """Добавляет рецепты в ленты подписчиков авторов одним запросом"""
+        if not recipe_ids:
+            return 0
+        return self.insert_select(
+            'SELECT follow.user_id, recipe.id, recipe.author_id, '
+            'recipe.pub_date '
+            f'FROM {Recipe._meta.db_table} AS recipe '
+            f'JOIN {Follow._meta.db_table} AS follow '
+            'ON follow.author_id = recipe.author_id '
+            f'WHERE recipe.id IN ({", ".join(["%s"] * len(recipe_ids))}) '
+            f'AND {self.not_celebrity("recipe.author_id")}',
+            list(recipe_ids),
+        )
+
+    def backfill(self, user_ids, author_ids=None):
+        """Последние рецепты авторов, на которых подписаны user_ids.
+
+        Берётся до FEED_BACKFILL_PER_AUTHOR рецептов каждого автора,
+        author_ids ограничивает авторов, например только новыми подписками.
+        """
+        if not user_ids or author_ids is not None and not author_ids:
+            return 0
+        conditions = [
+            f'follow.user_id IN ({", ".join(["%s"] * len(user_ids))})',
+            self.not_celebrity('follow.author_id'),
+        ]
+        params = list(user_ids)
+        if author_ids is not None:
+            conditions.append(
+                f'follow.author_id IN ({", ".join(["%s"] * len(author_ids))})'
+            )
+            params.extend(author_ids)
+        return self.insert_select(
+            'SELECT user_id, id, author_id, pub_date FROM ('
+            'SELECT follow.user_id, recipe.id, recipe.author_id, '
+            'recipe.pub_date, ROW_NUMBER() OVER ('
+            'PARTITION BY follow.user_id, recipe.author_id '
+            'ORDER BY recipe.pub_date DESC, recipe.id DESC'
+            ') AS author_position '
+            f'FROM {Follow._meta.db_table} AS follow '
+            f'JOIN {Recipe._meta.db_table} AS recipe '
+            'ON recipe.author_id = follow.author_id '
+            f'WHERE {" AND ".join(conditions)}'
+            ') AS ranked WHERE author_position <= %s',
+            [*params, settings.FEED_BACKFILL_PER_AUTHOR],
+        )
+
+    def page(self, user, limit, before=None):
+        """Ключи (pub_date, recipe_id) страницы ленты после ключа before.
+
+        Записи ленты сливаются с рецептами авторов, которые не
+        раздаются при записи; каждый источник читается по индексу
+        не дальше limit строк.
+        """
+        entries = self.filter(user=user)
+        celebrities = list(user.follower.filter(
+            author__stats__feed_pulled=True
+        ).values_list('author_id', flat=True))
+        pulled = Recipe.objects.filter(author_id__in=celebrities)
+        if before is not None:
+            entries = entries.filter(
+                before_key('pub_date', 'recipe_id', before)
+            )
+            pulled = pulled.filter(before_key('pub_date', 'id', before))
+        keys = set(entries.order_by('-pub_date', '-recipe_id').values_list(
+            'pub_date', 'recipe_id'
+        )[:limit])
+        if celebrities:
+            keys.update(pulled.order_by('-pub_date', '-id').values_list(
+                'pub_date', 'id'
+            )[:limit])
+        return sorted(keys, reverse=True)[:limit]
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Пользователь',
+        db_index=False,
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    objects = FeedEntryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        ordering = ('-pub_date', '-recipe_id')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'], name='feed_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.recipe}'
@@ -0,0 +1,178 @@
+import sqlite3
+from itertools import islice
+
+from django.db import connection
+from django.db.models import Max
+
+
+def chunked(iterable, size):
+    """Разбивает итерируемый объект на списки не длиннее size"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_create_with_pks(model, objs, batch_size=None):
+    """bulk_create, после которого у всех объектов заполнен pk.
+
+    Если база не возвращает ключи вставленных строк, ключи назначаются
+    заранее от текущего максимума, поэтому вызывать нужно в транзакции.
+    """
+    if not connection.features.can_return_rows_from_bulk_insert:
+        last_pk = model.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+        for pk, obj in enumerate(objs, start=last_pk + 1):
+            obj.pk = pk
+    return model.objects.bulk_create(objs, batch_size=batch_size)
+
+
+def can_return_rows():
+    """Поддерживает ли база RETURNING во вставке и удалении.
+
+    Django 3.2 не включает эту возможность для SQLite, хотя RETURNING
+    там есть с версии 3.35.
+    """
+    if connection.vendor == 'sqlite':
+        return sqlite3.sqlite_version_info >= (3, 35)
+    return connection.features.can_return_rows_from_bulk_insert
+
+
+def insert_ignore_conflicts(model, objs):
+    """Вставляет объекты, пропуская конфликты уникальности.
+
+    В отличие от bulk_create(ignore_conflicts=True) возвращает число
+    действительно вставленных строк: по RETURNING, если база его
+    поддерживает, иначе по rowcount. Первичные ключи объектам
+    не назначаются.
+    """
+    meta = model._meta
+    fields = [field for field in meta.concrete_fields if not field.primary_key]
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(quote_name(field.column) for field in fields)
+    returning = can_return_rows()
+    inserted = 0
+    batch_size = max(connection.ops.bulk_batch_size(fields, objs), 1)
+    with connection.cursor() as cursor:
+        for batch in chunked(objs, batch_size):
+            rows = ', '.join(
+                [f'({", ".join(["%s"] * len(fields))})'] * len(batch)
+            )
+            sql = (
+                f'{connection.ops.insert_statement(ignore_conflicts=True)} '
+                f'{quote_name(meta.db_table)} ({columns}) VALUES {rows} '
+                f'{connection.ops.ignore_conflicts_suffix_sql(True)}'
+            )
+            if returning:
+                sql += f' RETURNING {quote_name(meta.pk.column)}'
+            cursor.execute(sql, [
+                field.get_db_prep_save(getattr(obj, field.attname), connection)
+                for obj in batch
+                for field in fields
+            ])
+            inserted += (
+                len(cursor.fetchall()) if returning else cursor.rowcount
+            )
+    return inserted
+
+
+def insert_select_sql(model, values, parent, condition):
+    """SQL вставки строки для каждой записи parent, подходящей под condition.
+
+    Конфликт уникальности игнорируется. Возвращает SQL и параметры
+    значений, которые идут перед параметрами condition.
+    """
+    meta = model._meta
+    parent_field = meta.get_field(parent)
+    parent_meta = parent_field.related_model._meta
+    quote_name = connection.ops.quote_name
+    columns, selected, params = [], [], []
+    for name, value in values.items():
+        field = meta.get_field(name)
+        columns.append(quote_name(field.column))
+        if name == parent:
+            selected.append(quote_name(parent_meta.pk.column))
+        else:
+            selected.append('%s')
+            params.append(value)
+    sql = (
+        f'{connection.ops.insert_statement(ignore_conflicts=True)} '
+        f'{quote_name(meta.db_table)} ({", ".join(columns)}) '
+        f'SELECT {", ".join(selected)} '
+        f'FROM {quote_name(parent_meta.db_table)} '
+        f'WHERE {quote_name(parent_meta.pk.column)} {condition} '
+        f'{connection.ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}'
+    )
+    return sql, params
+
+
+def insert_if_exists(model, values, parent):
+    """Вставляет строку одним запросом, игнорируя конфликт уникальности.
+
+    values — значения полей по именам; строка вставляется, только если
+    существует запись, на которую ссылается внешний ключ parent.
+    Возвращает число вставленных строк.
+    """
+    sql, params = insert_select_sql(model, values, parent, '= %s')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, values[parent]])
+        return cursor.rowcount
+
+
+def insert_many_if_exist(model, values, parent, parent_ids):
+    """Как insert_if_exists, но для нескольких значений parent сразу.
+
+    Возвращает список тех parent_ids, для которых строка действительно
+    вставлена: уже существующие строки, в том числе вставленные
+    параллельным запросом, в него не попадают. Если база умеет
+    возвращать вставленные строки, всё делается одним запросом,
+    иначе — по запросу на каждое значение.
+    """
+    if not parent_ids:
+        return []
+    if not can_return_rows():
+        return [
+            pk for pk in parent_ids
+            if insert_if_exists(model, {**values, parent: pk}, parent)
+        ]
+    column = model._meta.get_field(parent).column
+    sql, params = insert_select_sql(
+        model, {**values, parent: None}, parent,
+        f'IN ({", ".join(["%s"] * len(parent_ids))})',
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{sql} RETURNING {connection.ops.quote_name(column)}',
+            [*params, *parent_ids],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def delete_returning(queryset, field):
+    """Удаляет строки queryset, возвращая значения field удалённых строк.
+
+    Строки, удалённые параллельным запросом, в результат не попадают.
+    Удаление идёт одним запросом в обход Model.delete(), поэтому у модели
+    не должно быть зависимых объектов и сигналов удаления. Без поддержки
+    RETURNING строки сначала блокируются, вызывать нужно в транзакции.
+    """
+    meta = queryset.model._meta
+    if not can_return_rows():
+        values = list(
+            queryset.select_for_update().values_list(field, flat=True)
+            .order_by()
+        )
+        if values:
+            queryset.filter(**{f'{field}__in': values}).delete()
+        return values
+    quote_name = connection.ops.quote_name
+    subquery, params = queryset.values('pk').order_by().query.sql_with_params()
+    sql = (
+        f'DELETE FROM {quote_name(meta.db_table)} '
+        f'WHERE {quote_name(meta.pk.column)} IN ({subquery}) '
+        f'RETURNING {quote_name(meta.get_field(field).column)}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
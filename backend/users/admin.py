@@ -1,21 +1,60 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
+from django.db import transaction
+from recipes.admin import ReadOnlyAdmin
+from recipes.models import before_users_delete
 
-from .models import Follow
+from .models import AuthorStats, Follow
 
 
 class CustomUserAdmin(UserAdmin):
-    list_display = ('email', 'username')
+    list_display = ('email', 'username', 'recipes_count', 'followers_count')
     list_filter = ('email', 'username')
+    list_select_related = ('stats',)
+
+    @admin.display(description='Рецептов')
+    def recipes_count(self, obj):
+        return self.get_stats(obj).recipes_count
+
+    @admin.display(description='Подписчиков')
+    def followers_count(self, obj):
+        return self.get_stats(obj).followers_count
+
+    def get_stats(self, obj):
+        try:
+            return obj.stats
+        except AuthorStats.DoesNotExist:
+            return AuthorStats(user=obj)
+
+    @transaction.atomic()
+    def delete_model(self, request, obj):
+        before_users_delete([obj.id])
+        super().delete_model(request, obj)
+
+    @transaction.atomic()
+    def delete_queryset(self, request, queryset):
+        before_users_delete(queryset.values('id'))
+        super().delete_queryset(request, queryset)
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(ReadOnlyAdmin):
     list_display = ('id', 'user', 'author')
     search_fields = ('user', 'author')
     list_filter = ('user', 'author')
 
 
+@admin.register(AuthorStats)
+class AuthorStatsAdmin(admin.ModelAdmin):
+    list_display = (
+        'user', 'recipes_count', 'followers_count', 'feed_pulled'
+    )
+    list_select_related = ('user',)
+    readonly_fields = (
+        'user', 'recipes_count', 'followers_count', 'feed_pulled'
+    )
+
+
 admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
@@ -0,0 +1,66 @@
+# Generated by Django 3.2 on 2026-10-17 06:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 1000
+
+
+def count_subquery(queryset):
+    return Coalesce(Subquery(
+        queryset.order_by().values('author').annotate(
+            count=Count('pk')
+        ).values('count')
+    ), 0)
+
+
+def fill_stats(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Follow = apps.get_model('users', 'Follow')
+    AuthorStats = apps.get_model('users', 'AuthorStats')
+    authors = User.objects.annotate(
+        recipes_count=count_subquery(
+            Recipe.objects.filter(author=OuterRef('pk'))
+        ),
+        followers_count=count_subquery(
+            Follow.objects.filter(author=OuterRef('pk'))
+        ),
+    ).filter(
+        Q(recipes_count__gt=0) | Q(followers_count__gt=0)
+    ).values_list('id', 'recipes_count', 'followers_count')
+    AuthorStats.objects.bulk_create((
+        AuthorStats(
+            user_id=user_id,
+            recipes_count=recipes_count,
+            followers_count=followers_count,
+        )
+        for user_id, recipes_count, followers_count in authors.iterator()
+    ), batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0001_initial'),
+        ('recipes', '0009_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='auth.user', verbose_name='Автор')),
+                ('recipes_count', models.PositiveIntegerField(default=0, verbose_name='Количество рецептов')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Количество подписчиков')),
+            ],
+            options={
+                'verbose_name': 'Статистика автора',
+                'verbose_name_plural': 'Статистика авторов',
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
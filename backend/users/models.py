@@ -1,5 +1,8 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
 
 User = get_user_model()
 
@@ -31,3 +34,150 @@ class Follow(models.Model):
 
     def __str__(self):
         return f'Подписчик {self.user} - автор {self.author}'
+
+
+def count_subquery(queryset, field):
+    """Число строк queryset на значение field как коррелированный подзапрос"""
+    return Coalesce(Subquery(
+        queryset.order_by().values(field).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), 0)
+
+
+def pulled_after(condition):
+    """Новое значение feed_pulled: отметка не снимается, а только ставится"""
+    return Case(
+        When(Q(feed_pulled=True) | condition, then=Value(True)),
+        default=Value(False),
+    )
+
+
+class AuthorStatsQuerySet(models.QuerySet):
+    def actual(self, user_ids=None):
+        """Пользователи с пересчитанными по исходным таблицам счётчиками"""
+        from recipes.models import Recipe
+
+        users = User.objects.all()
+        if user_ids is not None:
+            users = users.filter(pk__in=user_ids)
+        return users.annotate(
+            actual_recipes_count=count_subquery(
+                Recipe.objects.filter(author=OuterRef('pk')), 'author'
+            ),
+            actual_followers_count=count_subquery(
+                Follow.objects.filter(author=OuterRef('pk')), 'author'
+            ),
+        )
+
+    def change_counter(self, field, user_ids, delta):
+        """Атомарно изменяет счётчик field авторов user_ids на delta.
+
+        Если у автора ещё нет строки статистики, она создаётся
+        с пересчитанными значениями, которые уже учитывают изменение.
+        Автор, число подписчиков которого превысило порог раздачи,
+        отмечается как читаемый при запросе ленты.
+        """
+        user_ids = set(user_ids)
+        if not user_ids or not delta:
+            return
+        changes = {field: Greatest(F(field) + delta, 0)}
+        if field == 'followers_count' and delta > 0:
+            threshold = settings.FEED_FANOUT_MAX_FOLLOWERS - delta
+            changes['feed_pulled'] = pulled_after(
+                Q(followers_count__gt=threshold)
+            )
+        updated = self.filter(user_id__in=user_ids).update(**changes)
+        if updated == len(user_ids):
+            return
+        missing = user_ids - set(self.filter(
+            user_id__in=user_ids
+        ).values_list('user_id', flat=True))
+        # Строки создаются под блокировкой пользователей: параллельный
+        # вызов дожидается вставки и меняет уже созданную строку,
+        # а не теряет своё изменение на конфликте.
+        list(User.objects.select_for_update().filter(
+            pk__in=missing
+        ).order_by('pk').values_list('pk', flat=True))
+        created = set(self.filter(
+            user_id__in=missing
+        ).values_list('user_id', flat=True))
+        if created:
+            self.filter(user_id__in=created).update(**changes)
+            missing -= created
+        self.bulk_create([
+            self.model(
+                user_id=user.id,
+                recipes_count=user.actual_recipes_count,
+                followers_count=user.actual_followers_count,
+                feed_pulled=(
+                    user.actual_followers_count
+                    > settings.FEED_FANOUT_MAX_FOLLOWERS
+                ),
+            )
+            for user in self.actual(missing)
+        ], ignore_conflicts=True)
+
+    def subtract_rows(self, field, rows, column):
+        """Вычитает из счётчика field авторов число их строк rows.
+
+        rows — ещё не удалённые строки, column — поле rows со ссылкой
+        на автора. Недостающие строки статистики не создаются: при
+        создании их значения пересчитываются по исходным таблицам.
+        """
+        return self.filter(user__in=rows.values(column)).update(**{
+            field: Greatest(F(field) - count_subquery(
+                rows.filter(**{column: OuterRef('user')}), column
+            ), 0),
+        })
+
+    def mark_pulled(self):
+        """Отмечает авторов, у которых подписчиков больше порога раздачи"""
+        return self.update(feed_pulled=pulled_after(
+            Q(followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS)
+        ))
+
+    def reset_pulled(self):
+        """Отметки заново по текущему числу подписчиков.
+
+        Снятую отметку должна сопровождать пересборка лент подписчиков
+        автора, поэтому вызывается только из rebuild_feed.
+        """
+        return self.update(feed_pulled=Case(
+            When(
+                followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+                then=Value(True),
+            ),
+            default=Value(False),
+        ))
+
+
+class AuthorStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Автор',
+    )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+    )
+    feed_pulled = models.BooleanField(
+        verbose_name='Рецепты читаются при запросе ленты',
+        default=False,
+    )
+
+    objects = AuthorStatsQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
+
+    def __str__(self):
+        return f'Статистика {self.user}'